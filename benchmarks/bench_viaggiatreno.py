@@ -0,0 +1,289 @@
+"""
+Benchmark di fetch_data / fetch_train_data contro un finto ViaggiaTreno locale.
+
+Avvia un server aiohttp che risponde su partenze, arrivi, andamentoTreno,
+tratteCanvas e cercaNumeroTrenoTrenoAutocomplete con latenza ed errori
+configurabili, poi misura per ogni combinazione stazioni × treni:
+
+  - latenza end-to-end di un poll completo (p50 / p95); con --tail-rate
+    una frazione di risposte arriva dopo --tail-ms (coda lunga, per
+    misurare le richieste duplicate del client; --no-hedging le spegne)
+  - richieste HTTP per poll (contate dal server)
+  - CPU per aggiornamento (process_time)
+  - picco di memoria allocata durante il poll (tracemalloc)
+
+Le risposte sono generate con la stessa forma di quelle reali; con
+--fixtures DIR si usano invece payload registrati (partenze.json,
+arrivi.json, andamentoTreno.json, tratteCanvas.json, autocomplete.txt).
+
+Uso (dalla root del repo, in un ambiente con homeassistant installato):
+
+    python benchmarks/bench_viaggiatreno.py --stations 1,5,15 --trains 1,5,20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from custom_components.mytreno.client import ViaggiaTrenoClient, create_session  # noqa: E402
+from custom_components.mytreno.const import DATA_CLIENT, DOMAIN  # noqa: E402
+from custom_components.mytreno.governor import TokenBucket  # noqa: E402
+from custom_components.mytreno.utils import (  # noqa: E402
+    fetch_data,
+    fetch_train_data,
+)
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Payload
+# ─────────────────────────────────────────────────────────────────────────────
+_MIDNIGHT_MS = int(time.time() // 86400 * 86400 * 1000)
+
+
+def _board(kind: str, rows: int = 40) -> list[dict]:
+    suffix = "Partenza" if kind == "partenze" else "Arrivo"
+    board = []
+    for i in range(rows):
+        board.append({
+            "numeroTreno": 2000 + i,
+            "compNumeroTreno": f"REG {2000 + i}",
+            "categoriaDescrizione": "REG",
+            f"compOrario{suffix}": f"{6 + i // 4:02d}:{i % 4 * 15:02d}",
+            f"orario{suffix}": _MIDNIGHT_MS + (6 * 60 + i * 15) * 60_000,
+            "destinazione": "ROMA TERMINI",
+            "origine": "NAPOLI CENTRALE",
+            "codOrigine": "S09218",
+            "dataPartenzaTreno": _MIDNIGHT_MS,
+            "ritardo": i % 7,
+            f"binarioProgrammato{suffix}Descrizione": "III",
+            f"binarioEffettivo{suffix}Descrizione": "4",
+        })
+    return board
+
+
+def _andamento() -> dict:
+    return {
+        "ritardo": 5,
+        "compRitardoAndamento": ["con un ritardo di 5 min.", "5 minutes late"],
+        "stazioneUltimoRilevamento": "LATINA",
+        "oraUltimoRilevamento": int(time.time() * 1000),
+    }
+
+
+def _tratte(stops: int = 15) -> list[dict]:
+    start = _MIDNIGHT_MS + 8 * 3_600_000
+    tratte = []
+    for i in range(stops):
+        passed = i < stops // 2
+        ms = start + i * 600_000
+        tratte.append({"fermata": {
+            "stazione": f"STAZIONE {i}",
+            "programmata": ms,
+            "effettiva": ms + 120_000 if passed else None,
+            "ritardo": 2 if passed else 0,
+            "arrivoReale": ms + 120_000 if passed else None,
+            "partenzaReale": None,
+            "binarioProgrammatoArrivoDescrizione": "II",
+            "binarioEffettivoArrivoDescrizione": "2" if passed else None,
+        }})
+    return tratte
+
+
+def _load_payloads(fixtures: str | None) -> dict:
+    payloads = {
+        "partenze":       _board("partenze"),
+        "arrivi":         _board("arrivi"),
+        "andamentoTreno": _andamento(),
+        "tratteCanvas":   _tratte(),
+        "autocomplete":   None,
+    }
+    if fixtures:
+        for name in ("partenze", "arrivi", "andamentoTreno", "tratteCanvas"):
+            path = os.path.join(fixtures, f"{name}.json")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    payloads[name] = json.load(f)
+        path = os.path.join(fixtures, "autocomplete.txt")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                payloads["autocomplete"] = f.read()
+    return payloads
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Finto server ViaggiaTreno
+# ─────────────────────────────────────────────────────────────────────────────
+class FakeViaggiaTreno:
+    def __init__(
+        self, payloads: dict, latency: float, jitter: float, error_rate: float,
+        tail_rate: float = 0.0, tail: float = 0.0,
+    ):
+        self.payloads   = payloads
+        self.latency    = latency
+        self.jitter     = jitter
+        self.error_rate = error_rate
+        self.tail_rate  = tail_rate
+        self.tail       = tail
+        self.requests   = 0
+        self.bytes_sent = 0
+
+    async def _respond(self, body, as_text: bool = False) -> web.Response:
+        self.requests += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if random.random() < self.tail_rate:
+            delay += self.tail
+        await asyncio.sleep(delay)
+        if random.random() < self.error_rate:
+            return web.Response(status=503)
+        text = body if as_text else json.dumps(body)
+        self.bytes_sent += len(text)
+        return web.Response(
+            text=text, content_type="text/plain" if as_text else "application/json"
+        )
+
+    def app(self) -> web.Application:
+        async def board(request):
+            return await self._respond(self.payloads[request.match_info["kind"]])
+
+        async def train(request):
+            return await self._respond(self.payloads[request.match_info["kind"]])
+
+        async def autocomplete(request):
+            tn = request.match_info["tn"]
+            text = self.payloads["autocomplete"] or (
+                f"{tn} - NAPOLI CENTRALE|{tn}-S09218-{_MIDNIGHT_MS}\n"
+            )
+            return await self._respond(text, as_text=True)
+
+        app = web.Application()
+        app.router.add_get("/{kind:partenze|arrivi}/{station}/{ts}", board)
+        app.router.add_get(
+            "/{kind:andamentoTreno|tratteCanvas}/{station}/{tn}/{ts}", train
+        )
+        app.router.add_get("/cercaNumeroTrenoTrenoAutocomplete/{tn}", autocomplete)
+        return app
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Misure
+# ─────────────────────────────────────────────────────────────────────────────
+async def _poll(hass, stations: list[str], trains: list[str]) -> None:
+    await asyncio.gather(
+        *(fetch_data(hass, sid) for sid in stations),
+        *(fetch_train_data(hass, tn) for tn in trains),
+        return_exceptions=True,
+    )
+
+
+async def run_scenario(
+    server: FakeViaggiaTreno, base_url: str, n_stations: int, n_trains: int,
+    polls: int, warm: bool, hedging: bool = True,
+) -> dict:
+    stations = [f"S{10000 + i}" for i in range(n_stations)]
+    trains   = [str(9000 + i) for i in range(n_trains)]
+
+    async with create_session() as session:   # stessa sessione tarata dell'integrazione
+        # rate limit disattivato: si misura l'integrazione, non il governor
+        client = ViaggiaTrenoClient(
+            session, base_url, bucket=TokenBucket(rate=1e9, burst=10**9),
+            hedging=hedging,
+        )
+        hass = SimpleNamespace(data={DOMAIN: {DATA_CLIENT: client}})
+
+        latencies, cpu, requests = [], [], []
+        tracemalloc.start()
+        peak = 0
+        for _ in range(polls):
+            if not warm:
+                client.clear_cache()          # TTL scaduto fra un poll e l'altro
+            before = server.requests
+            tracemalloc.reset_peak()
+            t0, c0 = time.perf_counter(), time.process_time()
+            await _poll(hass, stations, trains)
+            latencies.append(time.perf_counter() - t0)
+            cpu.append(time.process_time() - c0)
+            requests.append(server.requests - before)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    latencies.sort()
+    updates = max(1, n_stations + n_trains)
+    return {
+        "stations": n_stations,
+        "trains":   n_trains,
+        "p50_ms":   statistics.median(latencies) * 1000,
+        "p95_ms":   latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "req_poll": statistics.mean(requests),
+        "cpu_ms_update": statistics.mean(cpu) * 1000 / updates,
+        "peak_kib": peak / 1024,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    server = FakeViaggiaTreno(
+        _load_payloads(args.fixtures),
+        args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate,
+        args.tail_rate, args.tail_ms / 1000,
+    )
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    header = f"{'stazioni':>8} {'treni':>6} {'p50 ms':>8} {'p95 ms':>8} " \
+             f"{'req/poll':>9} {'cpu ms/upd':>11} {'picco KiB':>10}"
+    print(header)
+    print("-" * len(header))
+    try:
+        for n_st in args.stations:
+            for n_tr in args.trains:
+                r = await run_scenario(
+                    server, base_url, n_st, n_tr, args.polls, args.warm,
+                    not args.no_hedging,
+                )
+                print(
+                    f"{r['stations']:>8} {r['trains']:>6} {r['p50_ms']:>8.1f} "
+                    f"{r['p95_ms']:>8.1f} {r['req_poll']:>9.1f} "
+                    f"{r['cpu_ms_update']:>11.2f} {r['peak_kib']:>10.0f}"
+                )
+    finally:
+        await runner.cleanup()
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stations", type=_int_list, default=[1, 5, 15])
+    parser.add_argument("--trains", type=_int_list, default=[0, 5, 20])
+    parser.add_argument("--polls", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0)
+    parser.add_argument("--tail-ms", type=float, default=3000)
+    parser.add_argument(
+        "--no-hedging", action="store_true",
+        help="niente richieste duplicate dopo il p95 (confronto)",
+    )
+    parser.add_argument("--fixtures", help="cartella con payload registrati")
+    parser.add_argument(
+        "--warm", action="store_true",
+        help="non svuotare la cache fra i poll (misura gli hit del client)",
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -1,17 +1,82 @@
+import asyncio
+import aiohttp
 import voluptuous as vol
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.core import (
+    HomeAssistant,
+    callback,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.update_coordinator import UpdateFailed
+from homeassistant.helpers.dispatcher import async_dispatcher_send
 import logging
 
-from .const import DOMAIN, SERVICE_SET_TRAIN
+from .catalog import async_get_station_index
+from .const import (
+    CONF_BOARD_ROWS,
+    CONF_BOARD_WINDOW,
+    DATA_HISTORY,
+    DATA_PREFETCH,
+    DATA_TRACKER,
+    DEFAULT_BOARD_ROWS,
+    DOMAIN,
+    SERVICE_ADD_TRAIN,
+    SERVICE_GET_BOARD,
+    SERVICE_GET_STATISTICS,
+    SERVICE_GET_TRAIN,
+    SERVICE_REMOVE_TRAIN,
+    SERVICE_SET_TRAIN,
+    SIGNAL_TRAIN_ADDED,
+    SIGNAL_TRAIN_REMOVED,
+)
+from .lifecycle import TRACKER_JOB, get_resources
+from .utils import BoardConfig, fetch_data, fetch_train_data
 
 _LOGGER = logging.getLogger(__name__)
 PLATFORMS = ["sensor"]
+SERVICES = (
+    SERVICE_SET_TRAIN,
+    SERVICE_ADD_TRAIN,
+    SERVICE_REMOVE_TRAIN,
+    SERVICE_GET_BOARD,
+    SERVICE_GET_TRAIN,
+    SERVICE_GET_STATISTICS,
+)
 
 SET_TRAIN_SCHEMA = vol.Schema({
     vol.Required("train_number"): cv.string,
-    vol.Optional("entry_id"): cv.string,
+    vol.Optional("entry_id"): cv.string,   # mantenuto per compatibilità
+})
+
+ADD_TRAIN_SCHEMA = vol.Schema({
+    vol.Required("train_number"): cv.string,
+    vol.Optional("origin_station_id"): cv.string,
+})
+
+REMOVE_TRAIN_SCHEMA = vol.Schema({
+    vol.Required("train_number"): cv.string,
+})
+
+GET_BOARD_SCHEMA = vol.Schema({
+    vol.Required("station"): cv.string,   # nome o id (“S08409”)
+    vol.Optional(CONF_BOARD_ROWS, default=DEFAULT_BOARD_ROWS):
+        vol.All(vol.Coerce(int), vol.Range(min=1, max=50)),
+    vol.Optional(CONF_BOARD_WINDOW, default=0):
+        vol.All(vol.Coerce(int), vol.Range(min=0, max=24 * 60)),
+})
+
+GET_TRAIN_SCHEMA = vol.Schema({
+    vol.Required("train_number"): cv.string,
+    vol.Optional("origin_station_id"): cv.string,
+})
+
+GET_STATISTICS_SCHEMA = vol.Schema({
+    vol.Required("train_number"): cv.string,
+    vol.Optional("station"): cv.string,   # nome della fermata, come in “fermate”
 })
 
 
@@ -26,39 +91,151 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN].setdefault(entry.entry_id, {})
 
+    # dati salvati (tabelloni, treni, risoluzioni, storico) e tracker
+    # prima delle piattaforme; riusati se ancora vivi (reload)
+    first = await get_resources(hass).async_acquire(entry.entry_id)
+
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
-    # Registra il servizio se non esiste già
-    if not hass.services.has_service(DOMAIN, SERVICE_SET_TRAIN):
+    # opzioni del tabellone cambiate → ricarica l'entry
+    entry.async_on_unload(entry.add_update_listener(_async_options_updated))
 
-        async def _handle_set_train(call: ServiceCall) -> None:
-            tn = call.data["train_number"]
-            entry_id = call.data.get("entry_id")
+    # prima entry: servizi (gli oggetti condivisi vivono in SharedResources)
+    if first:
+        _async_register_services(hass)
 
-            targets = (
-                [hass.data[DOMAIN].get(entry_id)]
-                if entry_id
-                else [hass.data[DOMAIN].get("global_tracking")]
-            )
+    return True
+
+
+@callback
+def _async_register_services(hass: HomeAssistant) -> None:
+    """Servizi del dominio, registrati dalla prima entry caricata."""
+
+    # refresh del tracker sempre via hub: mai in parallelo a un tick
+    def _refresh_tracker():
+        return get_resources(hass).hub.async_refresh(TRACKER_JOB)
+
+    async def _handle_set_train(call: ServiceCall) -> None:
+        tracker = hass.data[DOMAIN].get(DATA_TRACKER)
+        if tracker is None:
+            return
+        tn = call.data["train_number"]
+        tracker.async_select(tn)
+
+        prefetcher = hass.data[DOMAIN].get(DATA_PREFETCH)
+        snapshot = prefetcher.snapshot(tn) if prefetcher else None
+        if snapshot:
+            # già scaldato dal prefetch: subito visibile, refresh in background
+            tracker.async_apply_snapshot(tn, snapshot)
+            hass.async_create_task(_refresh_tracker())
+        else:
+            await _refresh_tracker()
+
+    async def _handle_add_train(call: ServiceCall) -> None:
+        tracker = hass.data[DOMAIN].get(DATA_TRACKER)
+        if tracker is None:
+            return
+        tn = call.data["train_number"]
+        origin = call.data.get("origin_station_id")
+        if origin:  # accetta anche il nome della stazione
+            index = await async_get_station_index(hass)
+            origin = index.resolve(origin) or origin
+        if tracker.async_add(tn, origin):
+            async_dispatcher_send(hass, SIGNAL_TRAIN_ADDED, tn)
+        await _refresh_tracker()
+
+    async def _handle_remove_train(call: ServiceCall) -> None:
+        tracker = hass.data[DOMAIN].get(DATA_TRACKER)
+        if tracker is None:
+            return
+        tn = call.data["train_number"]
+        if tracker.async_remove(tn):
+            async_dispatcher_send(hass, SIGNAL_TRAIN_REMOVED, tn)
 
-            for tgt in targets:
-                if not tgt:
-                    continue
-                container = tgt.get("train_container")
-                coordinator = tgt.get("train_coordinator")
-                if container is not None:
-                    container["train_number"] = tn
-                    if coordinator:
-                        await coordinator.async_request_refresh()
-
-        hass.services.async_register(
-            DOMAIN,
-            SERVICE_SET_TRAIN,
-            _handle_set_train,
-            schema=SET_TRAIN_SCHEMA
+    # Interrogazioni al volo (con risposta): nessuna entry né coordinator,
+    # passano dalla cache LRU/TTL del client condiviso
+    async def _handle_get_board(call: ServiceCall) -> ServiceResponse:
+        index = await async_get_station_index(hass)
+        station_id = index.resolve(call.data["station"])
+        if station_id is None:
+            raise HomeAssistantError(
+                f"Stazione sconosciuta: {call.data['station']}"
+            )
+        config = BoardConfig(
+            rows=call.data[CONF_BOARD_ROWS],
+            window_minutes=call.data[CONF_BOARD_WINDOW],
         )
+        try:
+            board = await fetch_data(hass, station_id, config)
+        except (UpdateFailed, aiohttp.ClientError, asyncio.TimeoutError) as err:
+            raise HomeAssistantError(str(err)) from err
+        return {
+            "station_id": station_id,
+            "stazione":   index.name(station_id),
+            **board.as_dict(),
+        }
 
-    return True
+    async def _handle_get_train(call: ServiceCall) -> ServiceResponse:
+        origin = call.data.get("origin_station_id")
+        if origin:
+            index = await async_get_station_index(hass)
+            origin = index.resolve(origin) or origin
+        try:
+            snapshot = await fetch_train_data(hass, call.data["train_number"], origin)
+        except (UpdateFailed, aiohttp.ClientError, asyncio.TimeoutError) as err:
+            raise HomeAssistantError(str(err)) from err
+        return snapshot.as_dict() if snapshot else {}
+
+    # Puntualità storica: solo dati locali, nessuna richiesta upstream
+    async def _handle_get_statistics(call: ServiceCall) -> ServiceResponse:
+        history = hass.data[DOMAIN][DATA_HISTORY]
+        tn = call.data["train_number"]
+        station = call.data.get("station")
+        return {
+            "train_number": tn,
+            "stazione": station,
+            **history.statistics(tn, station),
+        }
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_BOARD,
+        _handle_get_board,
+        schema=GET_BOARD_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_TRAIN,
+        _handle_get_train,
+        schema=GET_TRAIN_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_STATISTICS,
+        _handle_get_statistics,
+        schema=GET_STATISTICS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SET_TRAIN,
+        _handle_set_train,
+        schema=SET_TRAIN_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_ADD_TRAIN,
+        _handle_add_train,
+        schema=ADD_TRAIN_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_REMOVE_TRAIN,
+        _handle_remove_train,
+        schema=REMOVE_TRAIN_SCHEMA
+    )
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
@@ -68,9 +245,29 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id, None)
 
+        # il treno fisso dell'entry esce dal tracker se nessun altro lo segue;
+        # se invece resta seguito, il suo sensore (tolto con la piattaforma di
+        # questa entry) lo ricrea l'ospite
+        tracker = hass.data[DOMAIN].get(DATA_TRACKER)
+        train_number = entry.data.get("train_number")
+        if tracker and train_number:
+            if tracker.async_remove(train_number, owner=entry.entry_id):
+                async_dispatcher_send(hass, SIGNAL_TRAIN_REMOVED, train_number)
+            elif train_number in tracker.sensor_trains():
+                async_dispatcher_send(hass, SIGNAL_TRAIN_ADDED, train_number)
+
+        # ultima entry: via i servizi, il resto dopo un periodo di grazia
+        if get_resources(hass).async_release(entry.entry_id):
+            for service in SERVICES:
+                hass.services.async_remove(DOMAIN, service)
+
     return unload_ok
 
 
+async def _async_options_updated(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Reloads a config entry."""
     await async_unload_entry(hass, entry)
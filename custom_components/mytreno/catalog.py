@@ -0,0 +1,195 @@
+"""Catalogo stazioni: stations.json più le differenze scaricate da ViaggiaTreno."""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import time
+
+import aiohttp
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+from homeassistant.helpers.storage import Store
+
+from .client import get_client
+from .const import DATA_CATALOG, DATA_STATIONS, DOMAIN
+from .stations import StationIndex
+
+_LOGGER = logging.getLogger(__name__)
+
+STATIONS_FILE   = os.path.join(os.path.dirname(__file__), "stations.json")
+STORAGE_VERSION = 1
+STORAGE_KEY     = f"{DOMAIN}.stations"
+SAVE_DELAY      = 60
+
+REGIONS        = tuple(str(code) for code in range(23))   # codici di elencoStazioni
+FIRST_STEP     = 300                    # secondi dopo l'avvio: mai durante il setup
+STEP_INTERVAL  = timedelta(hours=1)     # una regione per passo
+REGION_MAX_AGE = 7 * 24 * 3600          # ogni regione riletta al più una volta a settimana
+REGION_RETRY   = 6 * 3600               # dopo una risposta non 200
+
+_LOAD_LOCK = "catalog_lock"             # in hass.data[DOMAIN]
+
+
+def _load_base() -> dict[str, str]:
+    with open(STATIONS_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _station_name(raw: str) -> str:
+    """“MILANO P.GARIBALDI” → “Milano P.Garibaldi” (come in stations.json)."""
+    return " ".join(raw.split()).title()
+
+
+class StationCatalog:
+    """
+    Elenco {nome: id} da cui si costruisce lo StationIndex.
+
+    - base: stations.json, letto una volta nell'executor
+    - extra: per regione, solo le stazioni che upstream conosce e il base
+      no; è l'unica parte salvata in .storage/mytreno.stations
+    - in background, mentre c'è almeno una entry caricata, si rilegge una
+      regione alla volta (elencoStazioni) e si fondono le differenze;
+      l'indice si ricostruisce solo se qualcosa è cambiato. All'avvio si
+      usa la versione salvata, senza attendere la rete
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self.base:      dict[str, str] = {}
+        self.extra:     dict[str, dict[str, str]] = {}   # regione → {id: nome}
+        self.refreshed: dict[str, float] = {}            # regione → epoch ultima lettura
+        self._base_ids: frozenset[str] = frozenset()
+        self._unsubs:   list[CALLBACK_TYPE] = []
+
+    async def async_load(self) -> None:
+        self.base = await self.hass.async_add_executor_job(_load_base)
+        self._base_ids = frozenset(self.base.values())
+        stored = await self._store.async_load() or {}
+        try:
+            self.extra = {
+                region: dict(stations)
+                for region, stations in stored.get("extra", {}).items()
+            }
+            self.refreshed = dict(stored.get("refreshed", {}))
+        except (AttributeError, TypeError, ValueError) as err:
+            _LOGGER.warning("Catalogo stazioni illeggibile, si riparte dal base: %s", err)
+            self.extra, self.refreshed = {}, {}
+
+    def stations(self) -> dict[str, str]:
+        """{nome: id}: stations.json più le stazioni nuove (il base vince sui nomi)."""
+        merged = dict(self.base)
+        for stations in self.extra.values():
+            for station_id, name in stations.items():
+                merged.setdefault(name, station_id)
+        return merged
+
+    def extra_count(self) -> int:
+        return sum(len(stations) for stations in self.extra.values())
+
+    @callback
+    def async_start(self) -> None:
+        if self._unsubs:
+            return
+        self._unsubs = [
+            async_call_later(self.hass, FIRST_STEP, self._async_step),
+            async_track_time_interval(self.hass, self._async_step, STEP_INTERVAL),
+        ]
+
+    @callback
+    def async_stop(self) -> None:
+        while self._unsubs:
+            self._unsubs.pop()()
+
+    async def async_flush(self) -> None:
+        """Salva subito, senza attendere il salvataggio ritardato."""
+        await self._store.async_save(self._data_to_save())
+
+    # ─────────────────────────────────────────────────────────────────────
+    async def _async_step(self, _now: datetime | None = None) -> None:
+        """Rilegge la regione aggiornata meno di recente, se è ora."""
+        region = min(REGIONS, key=lambda code: self.refreshed.get(code, 0))
+        if time.time() - self.refreshed.get(region, 0) < REGION_MAX_AGE:
+            return
+        try:
+            status, body = await get_client(self.hass).async_get(
+                "elencoStazioni", region
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            _LOGGER.debug("Catalogo: regione %s non aggiornata (%r)", region, err)
+            return
+
+        if status != 200:
+            # riprova fra REGION_RETRY, non fra una settimana; intanto passano
+            # avanti le altre regioni (una regione rotta non le blocca)
+            _LOGGER.debug("Catalogo: regione %s non aggiornata (HTTP %s)", region, status)
+            self.refreshed[region] = time.time() - REGION_MAX_AGE + REGION_RETRY
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+            return
+
+        self.refreshed[region] = time.time()
+        # una risposta vuota non cancella niente: più facile un guasto upstream
+        changed = isinstance(body, list) and bool(body) and self._merge(region, body)
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+        if changed:
+            index = await self.hass.async_add_executor_job(
+                StationIndex, self.stations()
+            )
+            self.hass.data.setdefault(DOMAIN, {})[DATA_STATIONS] = index
+
+    def _merge(self, region: str, body: list) -> bool:
+        found: dict[str, str] = {}
+        for item in body:
+            if not isinstance(item, dict):
+                continue
+            station_id = item.get("codStazione") or item.get("codiceStazione")
+            name = (item.get("localita") or {}).get("nomeLungo")
+            if station_id and name and station_id not in self._base_ids:
+                found[station_id] = _station_name(name)
+
+        known = self.extra.get(region, {})
+        if found == known:
+            return False
+        _LOGGER.debug(
+            "Catalogo regione %s: %d stazioni nuove, %d tolte",
+            region, len(found.keys() - known.keys()), len(known.keys() - found.keys()),
+        )
+        if found:
+            self.extra[region] = found
+        else:
+            self.extra.pop(region, None)
+        return True
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {"extra": self.extra, "refreshed": self.refreshed}
+
+
+async def async_get_catalog(hass: HomeAssistant) -> StationCatalog:
+    """
+    Catalogo condiviso. Lo chiedono anche config flow e servizi, fuori da
+    async_acquire: il lock evita due cataloghi (e timer orfani) in parallelo.
+    """
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    async with domain_data.setdefault(_LOAD_LOCK, asyncio.Lock()):
+        catalog = domain_data.get(DATA_CATALOG)
+        if catalog is None:
+            catalog = StationCatalog(hass)
+            await catalog.async_load()
+            domain_data[DATA_CATALOG] = catalog
+    return catalog
+
+
+async def async_get_station_index(hass: HomeAssistant) -> StationIndex:
+    """Indice condiviso, costruito nell'executor dal catalogo (mai dalla rete)."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    index = domain_data.get(DATA_STATIONS)
+    if index is None:
+        catalog = await async_get_catalog(hass)
+        index = await hass.async_add_executor_job(StationIndex, catalog.stations())
+        domain_data[DATA_STATIONS] = index
+    return index
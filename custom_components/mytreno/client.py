@@ -0,0 +1,386 @@
+"""Client condiviso verso ViaggiaTreno (uno per istanza di Home Assistant)."""
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+import json
+import time
+from datetime import date
+from typing import Any
+
+import aiohttp
+
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import Event, HomeAssistant, callback
+
+from .const import DATA_CLIENT, DOMAIN, URL_BASE
+from .governor import (
+    ENDPOINT_FAMILY,
+    CircuitBreaker,
+    CircuitOpenError,
+    NoTokenError,
+    TokenBucket,
+    is_failure,
+)
+from .metrics import EndpointStats, Metrics
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  TTL cache per endpoint (secondi) – 0 = mai in cache
+# ─────────────────────────────────────────────────────────────────────────────
+ENDPOINT_TTL = {
+    "partenze":                          60,
+    "arrivi":                            60,
+    "andamentoTreno":                    25,
+    "tratteCanvas":                      25,
+    "cercaNumeroTrenoTrenoAutocomplete": 600,
+}
+CACHE_MAX_ENTRIES = 512    # LRU: oltre si scarta la voce usata meno di recente
+STALE_GRACE       = 3600   # secondi oltre il TTL in cui un dato resta servibile
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Sessione HTTP dedicata: un solo host, tante piccole richieste JSON
+# ─────────────────────────────────────────────────────────────────────────────
+MAX_CONNECTIONS    = 8      # connessioni aperte verso URL_BASE (pool keep-alive)
+KEEPALIVE_TIMEOUT  = 30     # secondi di inattività prima di chiudere una connessione
+DNS_CACHE_TTL      = 300    # secondi
+_CLOSE_LISTENER    = "client_close_listener"   # chiave in hass.data[DOMAIN]
+SESSION_HEADERS    = {
+    "Accept":          "application/json, text/plain, */*",
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent":      "MyTreno (Home Assistant)",
+}
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Richieste duplicate (hedging) contro la coda lunga delle latenze
+# ─────────────────────────────────────────────────────────────────────────────
+HEDGE_MIN_SAMPLES = 20     # latenze recenti necessarie prima di duplicare
+HEDGE_MIN_DELAY   = 0.25   # secondi: mai duplicare prima di così
+HEDGE_MAX_RATIO   = 0.05   # al più una richiesta su 20 duplicata, per endpoint
+
+# timeout per famiglia di endpoint (vedi governor.ENDPOINT_FAMILY); il
+# `total` è anche la scadenza complessiva di una richiesta duplicata
+DEFAULT_TIMEOUT  = aiohttp.ClientTimeout(total=10, connect=4, sock_read=8)
+ENDPOINT_TIMEOUT = {
+    "board":  DEFAULT_TIMEOUT,
+    "train":  aiohttp.ClientTimeout(total=8, connect=4, sock_read=6),
+    "search": aiohttp.ClientTimeout(total=6, connect=4, sock_read=5),
+    # elenco stazioni di una regione: risposta grossa, in background
+    "catalog": aiohttp.ClientTimeout(total=30, connect=4, sock_read=20),
+}
+
+
+def create_session() -> aiohttp.ClientSession:
+    """Sessione con pool, keep-alive e cache DNS tarati su URL_BASE."""
+    connector = aiohttp.TCPConnector(
+        limit=MAX_CONNECTIONS,
+        limit_per_host=MAX_CONNECTIONS,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        enable_cleanup_closed=True,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=SESSION_HEADERS,
+        timeout=DEFAULT_TIMEOUT,
+        raise_for_status=False,
+    )
+
+
+class ViaggiaTrenoClient:
+    """
+    Punto unico per tutte le chiamate a URL_BASE.
+
+    - richieste identiche concorrenti → una sola chiamata HTTP (coalescing)
+    - risposte 200 tenute in cache per ENDPOINT_TTL[endpoint] secondi,
+      in una LRU limitata a CACHE_MAX_ENTRIES voci
+    - token bucket globale + circuit breaker per famiglia di endpoint
+      (a circuito aperto si serve l'ultimo dato in cache, anche se scaduto);
+      le richieste facoltative (`optional`) non fanno la coda per un token
+    - timeout per famiglia (ENDPOINT_TIMEOUT, sovrascrivibili con `timeouts`)
+    - una risposta più lenta del p95 recente dell'endpoint fa partire un
+      duplicato (se c'è un token libero): vince il primo, l'altro è annullato
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        base_url: str = URL_BASE,
+        bucket: TokenBucket | None = None,
+        timeouts: dict[str, aiohttp.ClientTimeout] | None = None,
+        hedging: bool = True,
+    ) -> None:
+        self._session  = session
+        self._hedging  = hedging
+        self._base_url = base_url
+        self._timeouts = {**ENDPOINT_TIMEOUT, **(timeouts or {})}
+        self._cache:    OrderedDict[tuple, tuple[float, int, Any]] = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self._bucket   = bucket or TokenBucket()
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self.metrics   = Metrics()
+        # numero treno → (giorno di servizio, candidati autocomplete)
+        self.resolutions: dict[str, tuple[date, list[dict]]] = {}
+        # numero treno → (giorno, candidato letto da un tabellone): solo una
+        # delle origini possibili, tenuto fuori dall'elenco completo
+        self.seeded: dict[str, tuple[date, dict]] = {}
+        # (origine, numero, data partenza) → (giorno, fermate (id, nome, programmata))
+        self.itineraries: dict[tuple, tuple[date, tuple]] = {}
+
+    async def async_get(
+        self,
+        endpoint: str,
+        *path: str,
+        key: tuple | None = None,
+        as_text: bool = False,
+        optional: bool = False,
+    ) -> tuple[int, Any]:
+        """
+        GET {base}/{endpoint}/{path...} → (status, body).
+
+        `key` sostituisce `path` come chiave di cache: serve per gli endpoint
+        che vogliono un timestamp “usa e getta” nell'URL (partenze/arrivi).
+        Con `optional` (prefetch) la richiesta parte solo se c'è subito un
+        token libero, altrimenti NoTokenError: mai davanti a quelle vere.
+        """
+        cache_key = (endpoint, *(path if key is None else key))
+
+        stats = self.metrics.endpoint(endpoint)
+
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            if time.monotonic() - cached[0] > STALE_GRACE:
+                del self._cache[cache_key]       # troppo vecchio anche da servire
+                cached = None
+            else:
+                self._cache.move_to_end(cache_key)
+                if cached[0] > time.monotonic():
+                    stats.cache_hits += 1
+                    return cached[1], cached[2]
+
+        # una richiesta identica già in volo (anche la prova half-open) si
+        # condivide prima di guardare il circuito
+        task = self._inflight.get(cache_key)
+        if task is not None:
+            stats.coalesced += 1
+        else:
+            family  = ENDPOINT_FAMILY.get(endpoint, endpoint)
+            breaker = self._breakers.setdefault(family, CircuitBreaker())
+            if breaker.is_open:
+                if cached is not None:   # scaduto, ma meglio che martellare l'upstream
+                    stats.stale_served += 1
+                    return cached[1], cached[2]
+                stats.rejected += 1
+                raise CircuitOpenError(f"ViaggiaTreno ({family}): circuito aperto")
+
+            if optional and not self._bucket.try_acquire():
+                raise NoTokenError(f"ViaggiaTreno ({endpoint}): nessun token libero")
+
+            breaker.begin_request()
+            task = asyncio.ensure_future(
+                self._async_fetch(
+                    cache_key, endpoint, path, as_text, breaker, has_token=optional
+                )
+            )
+            self._inflight[cache_key] = task
+            task.add_done_callback(
+                lambda t: self._fetch_done(cache_key, t, breaker)
+            )
+
+        # shield: se il chiamante viene cancellato, gli altri in attesa no
+        return await asyncio.shield(task)
+
+    def invalidate(self, endpoint: str, *key: str) -> None:
+        """Scarta una voce di cache (es. dopo un 204/404)."""
+        self._cache.pop((endpoint, *key), None)
+
+    def circuit_state(self) -> dict[str, dict]:
+        """Stato dei circuit breaker per famiglia (diagnostica)."""
+        now = time.monotonic()
+        return {
+            family: {
+                "open": breaker.is_open,
+                "failures": breaker.failures,
+                "retry_in_s": round(max(0.0, breaker.open_until - now)),
+            }
+            for family, breaker in self._breakers.items()
+        }
+
+    def clear_cache(self) -> None:
+        """Svuota la cache delle risposte (non le risoluzioni dei treni)."""
+        self._cache.clear()
+
+    async def async_close(self) -> None:
+        """Annulla le richieste in volo e chiude la sessione."""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if not self._session.closed:
+            await self._session.close()
+
+    # ─────────────────────────────────────────────────────────────────────
+    async def _async_fetch(
+        self,
+        cache_key: tuple,
+        endpoint: str,
+        path: tuple,
+        as_text: bool,
+        breaker: CircuitBreaker,
+        has_token: bool = False,
+    ) -> tuple[int, Any]:
+        url     = "/".join((self._base_url, endpoint, *path))
+        stats   = self.metrics.endpoint(endpoint)
+        timeout = self._timeouts.get(
+            ENDPOINT_FAMILY.get(endpoint, endpoint), DEFAULT_TIMEOUT
+        )
+        if not has_token:
+            await self._bucket.acquire()
+        start = time.perf_counter()
+        try:
+            status, text = await self._async_hedged(url, timeout, stats)
+            if as_text:
+                body = text
+            elif status == 200:
+                body = json.loads(text)
+            else:
+                body = None
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            breaker.record_failure()
+            raise
+        except (aiohttp.ClientError, ValueError):
+            stats.errors += 1
+            breaker.record_failure()
+            raise
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stats.latency.observe(elapsed_ms)
+        stats.recent.observe(elapsed_ms)
+        stats.bytes += len(text)
+        if status != 200:
+            stats.http_errors += 1
+        if is_failure(status):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        if status == 200 and (ttl := ENDPOINT_TTL.get(endpoint, 0)):
+            self._cache[cache_key] = (time.monotonic() + ttl, status, body)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > CACHE_MAX_ENTRIES:
+                self._cache.popitem(last=False)
+        return status, body
+
+    async def _async_request(
+        self, url: str, timeout: aiohttp.ClientTimeout
+    ) -> tuple[int, str]:
+        async with self._session.get(url, timeout=timeout) as res:
+            return res.status, await res.text()
+
+    def _hedge_delay(
+        self, stats: EndpointStats, timeout: aiohttp.ClientTimeout
+    ) -> float | None:
+        """Secondi dopo cui duplicare la richiesta; None = niente duplicato."""
+        if not self._hedging or stats.recent.count < HEDGE_MIN_SAMPLES:
+            return None
+        if stats.hedged >= HEDGE_MAX_RATIO * stats.requests:
+            return None
+        # al duplicato resta sempre almeno metà della scadenza
+        deadline = timeout.total or DEFAULT_TIMEOUT.total
+        return min(
+            max(stats.recent.percentile(0.95) / 1000, HEDGE_MIN_DELAY), deadline / 2
+        )
+
+    async def _async_hedged(
+        self, url: str, timeout: aiohttp.ClientTimeout, stats: EndpointStats
+    ) -> tuple[int, str]:
+        """
+        GET con al più un duplicato dopo il p95 recente: la prima risposta
+        valida (non 429/5xx) vince, l'altra richiesta viene annullata; se
+        nessuna lo è si ritorna la risposta d'errore. Entro `timeout.total`
+        dall'inizio, duplicato compreso, o asyncio.TimeoutError.
+        """
+        hedge_after = self._hedge_delay(stats, timeout)
+        if hedge_after is None:
+            return await self._async_request(url, timeout)
+
+        deadline = time.monotonic() + (timeout.total or DEFAULT_TIMEOUT.total)
+        primary  = asyncio.ensure_future(self._async_request(url, timeout))
+        hedge: asyncio.Future | None = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            # il duplicato non aspetta in coda al token bucket: o subito o niente
+            if done or not self._bucket.try_acquire():
+                return await primary
+
+            stats.hedged += 1
+            hedge   = asyncio.ensure_future(self._async_request(url, timeout))
+            pending = {primary, hedge}
+            error: BaseException = asyncio.TimeoutError()
+            fallback: tuple[int, str] | None = None   # 429/5xx, se non arriva di meglio
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(0.0, deadline - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    if fallback is None:
+                        raise asyncio.TimeoutError
+                    break
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()   # l'altra può ancora farcela
+                        continue
+                    status, text = task.result()
+                    if is_failure(status):
+                        fallback = (status, text)
+                        continue
+                    if task is hedge:
+                        stats.hedge_wins += 1
+                    return status, text
+            if fallback is not None:
+                return fallback
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()   # niente “Task exception was never retrieved”
+
+    def _fetch_done(
+        self, cache_key: tuple, task: asyncio.Task, breaker: CircuitBreaker
+    ) -> None:
+        self._inflight.pop(cache_key, None)
+        breaker.end_request()
+        if not task.cancelled():
+            task.exception()  # evita “Task exception was never retrieved”
+
+
+def get_client(hass: HomeAssistant) -> ViaggiaTrenoClient:
+    """Ritorna (creandolo al primo uso) il client condiviso di `hass`."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    client = domain_data.get(DATA_CLIENT)
+    if client is None:
+        client = domain_data[DATA_CLIENT] = ViaggiaTrenoClient(create_session())
+
+        @callback
+        def _async_close(_: Event) -> None:
+            domain_data.pop(_CLOSE_LISTENER, None)   # già consumato
+            hass.async_create_task(async_close_client(hass))
+
+        domain_data[_CLOSE_LISTENER] = hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_CLOSE, _async_close
+        )
+    return client
+
+
+async def async_close_client(hass: HomeAssistant) -> None:
+    """Chiude la sessione dedicata (ultima entry scaricata o HA in chiusura)."""
+    domain_data = hass.data.get(DOMAIN, {})
+    if remove_listener := domain_data.pop(_CLOSE_LISTENER, None):
+        remove_listener()
+    client = domain_data.pop(DATA_CLIENT, None)
+    if client is not None:
+        await client.async_close()
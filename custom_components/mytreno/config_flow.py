@@ -1,24 +1,39 @@
-import json
-import os
+import asyncio
+import aiohttp
 import voluptuous as vol
 from homeassistant import config_entries
-from .const import DOMAIN
+from homeassistant.core import callback
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.update_coordinator import UpdateFailed
+from .catalog import async_get_station_index
+from .const import (
+  BOARD_CATEGORIES,
+  CONF_BOARD_CATEGORIES,
+  CONF_BOARD_DESTINATIONS,
+  CONF_BOARD_ROWS,
+  CONF_BOARD_WINDOW,
+  CONF_PREFETCH,
+  DEFAULT_BOARD_ROWS,
+  DOMAIN,
+)
+from .utils import async_train_candidates
 
-# Cache stazioni
-_STATIONS = None
-
-def get_stations():
-  global _STATIONS
-  if _STATIONS is None:
-    file_path = os.path.join(os.path.dirname(__file__), "stations.json")
-    with open(file_path, encoding="utf-8") as f:
-      _STATIONS = json.load(f)
-  return _STATIONS
+MAX_STATION_MATCHES = 20
 
 
 class MyTrenoConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
   VERSION = 3
 
+  @staticmethod
+  @callback
+  def async_get_options_flow(config_entry):
+    return MyTrenoOptionsFlow(config_entry)
+
+  def __init__(self):
+    self._train_number = None
+    self._candidates = []
+    self._station_matches = []
+
   async def async_step_user(self, user_input=None):
     if user_input is not None:
       mode = user_input["mode"]
@@ -26,40 +41,108 @@ class MyTrenoConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         return await self.async_step_stazione()
       elif mode == "treno":
         return await self.async_step_treno()
+      elif mode == "tratta":
+        return await self.async_step_tratta()
 
     return self.async_show_form(
       step_id="user",
       data_schema=vol.Schema({
         vol.Required("mode"): vol.In({
           "stazione": "Monitor stazione",
-          "treno": "Tracciamento treno"
+          "treno": "Tracciamento treno",
+          "tratta": "Tratta da A a B"
         })
       })
     )
 
   async def async_step_stazione(self, user_input=None):
     errors = {}
-    stations = get_stations()
 
     if user_input is not None:
-      station_name = user_input.get("station_name")
-      station_id = stations.get(station_name)
+      index = await async_get_station_index(self.hass)
+      query = user_input.get("station_name", "")
+      station_id = index.station_id(query)
       if station_id:
+        return self._create_station_entry(index.name(station_id), station_id)
+
+      matches = index.search(query, MAX_STATION_MATCHES)
+      if len(matches) == 1:
+        return self._create_station_entry(matches[0], index.station_id(matches[0]))
+      if matches:
+        self._station_matches = matches
+        return await self.async_step_scegli_stazione()
+      errors["station_name"] = "invalid_station"
+
+    return self.async_show_form(
+      step_id="stazione",
+      data_schema=vol.Schema({
+        vol.Required("station_name"): str
+      }),
+      errors=errors
+    )
+
+  async def async_step_scegli_stazione(self, user_input=None):
+    """Più stazioni corrispondono alla ricerca: l'utente sceglie."""
+    if user_input is not None:
+      index = await async_get_station_index(self.hass)
+      station_name = user_input["station_name"]
+      return self._create_station_entry(station_name, index.station_id(station_name))
+
+    return self.async_show_form(
+      step_id="scegli_stazione",
+      data_schema=vol.Schema({
+        vol.Required("station_name"): vol.In(self._station_matches)
+      })
+    )
+
+  def _create_station_entry(self, station_name, station_id):
+    return self.async_create_entry(
+      title=station_name,
+      data={
+        "mode": "stazione",
+        "station_id": station_id,
+        "station_name": station_name,
+      }
+    )
+
+  async def async_step_tratta(self, user_input=None):
+    """Pendolare: prossimi treni dalla stazione A che fermano in B."""
+    errors = {}
+
+    if user_input is not None:
+      index = await async_get_station_index(self.hass)
+      ends = {}
+      for field in ("from_station", "to_station"):
+        query = user_input.get(field, "")
+        station_id = index.station_id(query)
+        if station_id is None:
+          matches = index.search(query, 2)
+          station_id = index.station_id(matches[0]) if len(matches) == 1 else None
+        if station_id is None:
+          errors[field] = "invalid_station"
+        else:
+          ends[field] = (station_id, index.name(station_id))
+
+      if not errors and ends["from_station"][0] == ends["to_station"][0]:
+        errors["to_station"] = "same_station"
+      if not errors:
+        (from_id, from_name), (to_id, to_name) = ends["from_station"], ends["to_station"]
         return self.async_create_entry(
-          title=station_name,
+          title=f"{from_name} → {to_name}",
           data={
-            "mode": "stazione",
-            "station_id": station_id,
-            "station_name": station_name,
+            "mode": "tratta",
+            "from_station_id": from_id,
+            "from_station_name": from_name,
+            "to_station_id": to_id,
+            "to_station_name": to_name,
           }
         )
-      else:
-        errors["station_name"] = "invalid_station"
 
     return self.async_show_form(
-      step_id="stazione",
+      step_id="tratta",
       data_schema=vol.Schema({
-        vol.Required("station_name"): vol.In(sorted(stations.keys()))
+        vol.Required("from_station"): str,
+        vol.Required("to_station"): str,
       }),
       errors=errors
     )
@@ -67,15 +150,20 @@ class MyTrenoConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
   async def async_step_treno(self, user_input=None):
     errors = {}
     if user_input is not None:
-      tn = user_input.get("train_number")
+      tn = (user_input.get("train_number") or "").strip()
       if tn and tn.isdigit():
-        return self.async_create_entry(
-          title=f"Treno {tn}",
-          data={
-            "mode": "treno",
-            "train_number": tn,
-          }
-        )
+        try:
+          candidates = await async_train_candidates(self.hass, tn)
+        except UpdateFailed:
+          errors["train_number"] = "train_not_found"
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+          errors["base"] = "cannot_connect"
+        else:
+          self._train_number = tn
+          self._candidates = candidates
+          if len(candidates) == 1:
+            return self._create_train_entry(candidates[0]["station_id"])
+          return await self.async_step_origine()
       else:
         errors["train_number"] = "invalid_train_number"
 
@@ -86,3 +174,72 @@ class MyTrenoConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
       }),
       errors=errors
     )
+
+  async def async_step_origine(self, user_input=None):
+    """Più treni con lo stesso numero: l'utente sceglie la stazione d'origine."""
+    if user_input is not None:
+      return self._create_train_entry(user_input["origin_station_id"])
+
+    return self.async_show_form(
+      step_id="origine",
+      data_schema=vol.Schema({
+        vol.Required("origin_station_id"): vol.In({
+          c["station_id"]: c["label"] for c in self._candidates
+        })
+      })
+    )
+
+  def _create_train_entry(self, origin_station_id):
+    tn = self._train_number
+    return self.async_create_entry(
+      title=f"Treno {tn}",
+      data={
+        "mode": "treno",
+        "train_number": tn,
+        "origin_station_id": origin_station_id,
+      }
+    )
+
+
+class MyTrenoOptionsFlow(config_entries.OptionsFlow):
+  """Opzioni del tabellone stazione: righe, finestra oraria, filtri."""
+
+  def __init__(self, config_entry):
+    self._entry = config_entry
+
+  async def async_step_init(self, user_input=None):
+    commute = bool(self._entry.data.get("from_station_id"))
+    if not self._entry.data.get("station_id") and not commute:
+      return self.async_abort(reason="no_options")
+
+    if user_input is not None:
+      return self.async_create_entry(title="", data=user_input)
+
+    options = self._entry.options
+    fields = {
+      vol.Optional(
+        CONF_BOARD_ROWS,
+        default=options.get(CONF_BOARD_ROWS, DEFAULT_BOARD_ROWS),
+      ): vol.All(vol.Coerce(int), vol.Range(min=1, max=50)),
+      vol.Optional(
+        CONF_BOARD_WINDOW,
+        default=options.get(CONF_BOARD_WINDOW, 0),
+      ): vol.All(vol.Coerce(int), vol.Range(min=0, max=24 * 60)),
+      vol.Optional(
+        CONF_BOARD_CATEGORIES,
+        default=options.get(CONF_BOARD_CATEGORIES, []),
+      ): cv.multi_select(BOARD_CATEGORIES),
+    }
+    # per una tratta la destinazione è B e non c'è prefetch
+    if not commute:
+      fields.update({
+        vol.Optional(
+          CONF_BOARD_DESTINATIONS,
+          default=options.get(CONF_BOARD_DESTINATIONS, ""),
+        ): str,
+        vol.Optional(
+          CONF_PREFETCH,
+          default=options.get(CONF_PREFETCH, 0),
+        ): vol.All(vol.Coerce(int), vol.Range(min=0, max=10)),
+      })
+    return self.async_show_form(step_id="init", data_schema=vol.Schema(fields))
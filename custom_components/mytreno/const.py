@@ -1,3 +1,33 @@
 DOMAIN = "mytreno"
 URL_BASE = "https://www.viaggiatreno.it/infomobilita/resteasy/viaggiatreno"
 SERVICE_SET_TRAIN = "set_train"
+SERVICE_ADD_TRAIN = "add_train"
+SERVICE_REMOVE_TRAIN = "remove_train"
+SERVICE_GET_BOARD = "get_board"
+SERVICE_GET_TRAIN = "get_train"
+SERVICE_GET_STATISTICS = "get_statistics"
+
+# chiavi in hass.data[DOMAIN]
+DATA_CLIENT = "client"
+DATA_TRACKER = "tracker"
+DATA_STATIONS = "stations"
+DATA_STORE = "store"
+DATA_PREFETCH = "prefetch"
+DATA_HISTORY = "history"
+DATA_RESOURCES = "resources"
+DATA_CATALOG = "catalog"
+
+# dispatcher: treno aggiunto / tolto dal tracker
+SIGNAL_TRAIN_ADDED = f"{DOMAIN}_train_added"
+SIGNAL_TRAIN_REMOVED = f"{DOMAIN}_train_removed"
+# dispatcher: l'entry che ospitava i sensori condivisi è stata scaricata
+SIGNAL_SHARED_HOST = f"{DOMAIN}_shared_host"
+
+# opzioni tabellone stazione
+CONF_BOARD_ROWS = "righe"
+CONF_BOARD_WINDOW = "finestra_minuti"
+CONF_BOARD_DESTINATIONS = "filtro_destinazione"
+CONF_BOARD_CATEGORIES = "categorie"
+CONF_PREFETCH = "prefetch_treni"   # primi N treni da scaldare, 0 = spento
+DEFAULT_BOARD_ROWS = 10
+BOARD_CATEGORIES = ["REG", "RV", "IC", "ICN", "FR", "FA", "FB", "EC", "EN", "BUS"]
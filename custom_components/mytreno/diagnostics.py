@@ -0,0 +1,50 @@
+"""Download diagnostica: metriche del client, circuit breaker e tracker."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .client import get_client
+from .const import DATA_CATALOG, DATA_RESOURCES, DATA_TRACKER, DOMAIN
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    client    = get_client(hass)
+    tracker   = hass.data[DOMAIN].get(DATA_TRACKER)
+    resources = hass.data[DOMAIN].get(DATA_RESOURCES)
+    catalog   = hass.data[DOMAIN].get(DATA_CATALOG)
+
+    return {
+        "entry": {
+            "title": entry.title,
+            "data":  dict(entry.data),
+        },
+        "metrics":  client.metrics.as_dict(),
+        "circuits": client.circuit_state(),
+        "tracker": {
+            "trains":   tracker.trains,
+            "selected": tracker.selected,
+            "update_interval_s": (
+                tracker.next_interval.total_seconds()
+                if tracker.next_interval else None
+            ),
+        } if tracker else None,
+        "hub": {
+            "ticks":          resources.hub.ticks,
+            "next_tick_in_s": resources.hub.next_tick_in(),
+        } if resources else None,
+        "resolutions": {
+            tn: {"day": day.isoformat(), "candidates": len(candidates)}
+            for tn, (day, candidates) in client.resolutions.items()
+        },
+        "itineraries": len(client.itineraries),
+        "catalog": {
+            "base":    len(catalog.base),
+            "extra":   catalog.extra_count(),
+            "regions": len(catalog.refreshed),
+        } if catalog else None,
+    }
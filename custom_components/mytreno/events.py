@@ -0,0 +1,97 @@
+"""Eventi sulle variazioni fra due snapshot: ritardi, binari, arrivi, soppressioni."""
+from __future__ import annotations
+
+from homeassistant.core import HomeAssistant
+
+from .models import Board, TrainSnapshot
+
+EVENT_DELAY_CHANGED    = "mytreno_delay_changed"
+EVENT_PLATFORM_CHANGED = "mytreno_platform_changed"
+EVENT_TRAIN_ARRIVED    = "mytreno_train_arrived"
+EVENT_TRAIN_CANCELLED  = "mytreno_train_cancelled"
+
+
+def _comparable(old: Board | TrainSnapshot | None) -> bool:
+    """Niente eventi contro uno snapshot assente o letto da disco."""
+    return old is not None and not old.stale
+
+
+def diff_board(
+    station_id: str, old: Board | None, new: Board
+) -> list[tuple[str, dict]]:
+    """Variazioni fra due tabelloni della stessa stazione."""
+    if not _comparable(old):
+        return []
+
+    events = []
+    for kind in ("partenze", "arrivi"):
+        previous = {row.treno: row for row in old.rows(kind)}
+        for row in new.rows(kind):
+            before = previous.get(row.treno)
+            if before is None:
+                continue
+            base = {"station_id": station_id, "tabellone": kind, "treno": row.treno}
+            if row.ritardo != before.ritardo:
+                events.append((EVENT_DELAY_CHANGED, {
+                    **base,
+                    "ritardo": row.ritardo,
+                    "ritardo_precedente": before.ritardo,
+                }))
+            if row.binario_effettivo != before.binario_effettivo:
+                events.append((EVENT_PLATFORM_CHANGED, {
+                    **base,
+                    "binario": row.binario_effettivo,
+                    "binario_precedente": before.binario_effettivo,
+                }))
+            if row.soppresso and not before.soppresso:
+                events.append((EVENT_TRAIN_CANCELLED, base))
+    return events
+
+
+def diff_train(
+    train_number: str, old: TrainSnapshot | None, new: TrainSnapshot | None
+) -> list[tuple[str, dict]]:
+    """Variazioni fra due snapshot dello stesso treno."""
+    if not _comparable(old) or new is None:
+        return []
+
+    events = []
+    base = {"train_number": train_number}
+    if new.ritardo != old.ritardo:
+        events.append((EVENT_DELAY_CHANGED, {
+            **base,
+            "ritardo": new.ritardo,
+            "ritardo_precedente": old.ritardo,
+            "ultima_stazione": new.ultima_stazione,
+        }))
+
+    previous = {f.stazione: f for f in old.fermate}
+    for fermata in new.fermate:
+        before = previous.get(fermata.stazione)
+        if before and fermata.binario != before.binario:
+            events.append((EVENT_PLATFORM_CHANGED, {
+                **base,
+                "stazione": fermata.stazione,
+                "binario": fermata.binario,
+                "binario_precedente": before.binario,
+            }))
+
+    fermate, fermate_old = new.fermate, old.fermate
+    if (
+        fermate and fermate_old
+        and fermate[-1].arrivato and not fermate_old[-1].arrivato
+    ):
+        events.append((EVENT_TRAIN_ARRIVED, {
+            **base,
+            "stazione": fermate[-1].stazione,
+            "ritardo": fermate[-1].ritardo,
+        }))
+
+    if new.soppresso and not old.soppresso:
+        events.append((EVENT_TRAIN_CANCELLED, base))
+    return events
+
+
+def fire_events(hass: HomeAssistant, events: list[tuple[str, dict]]) -> None:
+    for event_type, data in events:
+        hass.bus.async_fire(event_type, data)
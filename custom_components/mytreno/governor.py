@@ -0,0 +1,128 @@
+"""Governo del traffico verso ViaggiaTreno: rate limit, backoff, circuit breaker."""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+
+import aiohttp
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Parametri
+# ─────────────────────────────────────────────────────────────────────────────
+RATE_PER_SECOND   = 2.0    # richieste HTTP sostenute verso URL_BASE
+BURST             = 10     # richieste consentite “a raffica”
+FAILURE_THRESHOLD = 2      # errori consecutivi prima di aprire il circuito
+BACKOFF_BASE      = 30.0   # secondi, raddoppia a ogni errore successivo
+BACKOFF_MAX       = 900.0
+STARTUP_JITTER    = 20.0   # ritardo casuale max del primo refresh in background
+
+# famiglie di endpoint: un upstream che rifiuta i tabelloni non blocca i treni
+ENDPOINT_FAMILY = {
+    "partenze":                          "board",
+    "arrivi":                            "board",
+    "andamentoTreno":                    "train",
+    "tratteCanvas":                      "train",
+    "cercaNumeroTrenoTrenoAutocomplete": "search",
+    "elencoStazioni":                    "catalog",
+}
+
+
+class CircuitOpenError(aiohttp.ClientError):
+    """Circuito aperto per questa famiglia di endpoint e nessun dato in cache."""
+
+
+class NoTokenError(aiohttp.ClientError):
+    """Richiesta facoltativa senza un token libero subito: va rimandata."""
+
+
+def is_failure(status: int) -> bool:
+    """Risposte che indicano un upstream in difficoltà (non un dato mancante)."""
+    return status == 429 or status >= 500
+
+
+class TokenBucket:
+    """Token bucket asincrono: `await acquire()` attende il prossimo token."""
+
+    def __init__(self, rate: float = RATE_PER_SECOND, burst: int = BURST) -> None:
+        self._rate    = rate
+        self._burst   = burst
+        self._tokens  = float(burst)
+        self._updated = time.monotonic()
+        self._lock    = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:   # serializza l'attesa: ordine FIFO
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    def try_acquire(self) -> bool:
+        """Un token solo se libero subito e nessuno è in coda (richieste facoltative)."""
+        if self._lock.locked():
+            return False
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens  = min(
+            self._burst, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+
+class CircuitBreaker:
+    """
+    Stato di una famiglia di endpoint.
+
+    Dopo FAILURE_THRESHOLD errori consecutivi il circuito si apre per un
+    backoff esponenziale con jitter; alla scadenza passa una sola richiesta
+    di prova (half-open) e le altre restano fuori finché non ha risposto: se
+    va bene si richiude, altrimenti il backoff raddoppia.
+    """
+
+    def __init__(self) -> None:
+        self.failures   = 0
+        self.open_until = 0.0
+        self.probing    = False   # richiesta di prova in volo
+
+    @property
+    def is_open(self) -> bool:
+        return self.probing or time.monotonic() < self.open_until
+
+    def begin_request(self) -> None:
+        """Da chiamare quando parte una richiesta: dopo un'apertura è la prova."""
+        if self.failures >= FAILURE_THRESHOLD:
+            self.probing = True
+
+    def end_request(self) -> None:
+        """Richiesta finita anche senza esito (annullata, errore imprevisto)."""
+        self.probing = False
+
+    def record_success(self) -> None:
+        self.failures   = 0
+        self.open_until = 0.0
+        self.probing    = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing   = False
+        if self.failures >= FAILURE_THRESHOLD:
+            delay = min(
+                BACKOFF_MAX,
+                BACKOFF_BASE * 2 ** (self.failures - FAILURE_THRESHOLD),
+            )
+            # “equal jitter”: metà fissa, metà casuale
+            self.open_until = time.monotonic() + delay / 2 + random.uniform(0, delay / 2)
+
+
+def startup_delay() -> float:
+    """Ritardo casuale per non far partire tutti i refresh insieme all'avvio."""
+    return random.uniform(0, STARTUP_JITTER)
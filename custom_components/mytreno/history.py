@@ -0,0 +1,263 @@
+"""Storico ritardi compatto (ring buffer su array) con statistiche incrementali."""
+from __future__ import annotations
+
+from array import array
+import base64
+from datetime import datetime
+import logging
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import DATA_HISTORY, DOMAIN
+from .models import TrainSnapshot
+from .utils import _TZ
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY     = f"{DOMAIN}.history"
+SAVE_DELAY      = 300
+
+TRAIN_RING    = 512    # campioni per poll del ritardo del treno
+STOP_RING     = 64     # un campione al giorno per fermata
+MAX_DELAY_BIN = 90     # minuti; oltre finiscono nell'ultimo bin
+ON_TIME_MAX   = 5      # “in orario” se ritardo ≤ 5' (soglia Trenitalia)
+MAX_IDLE_DAYS = 90     # serie senza campioni da più giorni: scartate al load
+_BINS         = MAX_DELAY_BIN + 2
+WEEKDAYS      = ("lun", "mar", "mer", "gio", "ven", "sab", "dom")
+
+
+def _b64(arr: array) -> str:
+    return base64.b64encode(arr.tobytes()).decode()
+
+
+def _from_b64(typecode: str, value: str) -> array:
+    arr = array(typecode)
+    arr.frombytes(base64.b64decode(value))
+    return arr
+
+
+class DelayStats:
+    """
+    Contatori per giorno della settimana (0 = lunedì): numero campioni,
+    somma, in orario e istogramma a 1' per il p90. Aggiornati in O(1).
+    """
+
+    __slots__ = ("counts", "sums", "on_time", "hist")
+
+    def __init__(self) -> None:
+        self.counts  = array("I", bytes(4 * 7))
+        self.sums    = array("q", bytes(8 * 7))
+        self.on_time = array("I", bytes(4 * 7))
+        self.hist    = array("I", bytes(4 * 7 * _BINS))
+
+    def add(self, weekday: int, delay: int) -> None:
+        self.counts[weekday] += 1
+        self.sums[weekday]   += delay
+        if delay <= ON_TIME_MAX:
+            self.on_time[weekday] += 1
+        self.hist[weekday * _BINS + min(max(delay, 0), MAX_DELAY_BIN + 1)] += 1
+
+    def summary(self, weekday: int | None = None) -> dict:
+        days = range(7) if weekday is None else (weekday,)
+        count = sum(self.counts[d] for d in days)
+        if not count:
+            return {"campioni": 0}
+
+        # p90 dall'istogramma cumulato
+        rank, seen, p90 = 0.9 * count, 0, MAX_DELAY_BIN + 1
+        for b in range(_BINS):
+            seen += sum(self.hist[d * _BINS + b] for d in days)
+            if seen >= rank:
+                p90 = b
+                break
+        return {
+            "campioni":      count,
+            "ritardo_medio": round(sum(self.sums[d] for d in days) / count, 1),
+            "p90":           p90 if p90 <= MAX_DELAY_BIN else f">{MAX_DELAY_BIN}",
+            "in_orario":     round(sum(self.on_time[d] for d in days) / count, 3),
+        }
+
+    def as_dict(self) -> dict:
+        return {k: _b64(getattr(self, k)) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, raw: dict) -> DelayStats:
+        stats = cls()
+        for k in cls.__slots__:
+            if k in raw:
+                setattr(stats, k, _from_b64(getattr(stats, k).typecode, raw[k]))
+        return stats
+
+
+class DelaySeries:
+    """Ring buffer (minuto epoch, ritardo) + statistiche di una serie."""
+
+    __slots__ = ("times", "delays", "pos", "size", "stats", "last_day")
+
+    def __init__(self, size: int) -> None:
+        self.times    = array("l", bytes(array("l").itemsize * size))
+        self.delays   = array("h", bytes(2 * size))
+        self.pos      = 0
+        self.size     = 0
+        self.stats    = DelayStats()
+        self.last_day = 0   # ordinale dell'ultimo giorno conteggiato nelle stats
+
+    def append(self, minute: int, delay: int) -> None:
+        self.times[self.pos]  = minute
+        self.delays[self.pos] = max(-32768, min(32767, delay))
+        self.pos  = (self.pos + 1) % len(self.delays)
+        self.size = min(self.size + 1, len(self.delays))
+
+    def last_minute(self) -> int:
+        return self.times[(self.pos - 1) % len(self.times)] if self.size else 0
+
+    def samples(self) -> list[tuple[int, int]]:
+        """Campioni dal più vecchio al più recente."""
+        cap   = len(self.delays)
+        start = (self.pos - self.size) % cap
+        return [
+            (self.times[(start + i) % cap], self.delays[(start + i) % cap])
+            for i in range(self.size)
+        ]
+
+    def as_dict(self) -> dict:
+        return {
+            "times": _b64(self.times), "delays": _b64(self.delays),
+            "pos": self.pos, "size": self.size, "last_day": self.last_day,
+            "stats": self.stats.as_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, raw: dict, size: int) -> DelaySeries:
+        series = cls(size)
+        times, delays = _from_b64("l", raw["times"]), _from_b64("h", raw["delays"])
+        if len(times) == len(delays) == size:
+            series.times, series.delays = times, delays
+            series.pos, series.size = raw["pos"], raw["size"]
+        series.last_day = raw.get("last_day", 0)
+        series.stats    = DelayStats.from_dict(raw.get("stats", {}))
+        return series
+
+
+def _as_int(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _stop_key(train_number: str, station) -> str:
+    return f"{train_number}|{str(station).strip().upper()}"
+
+
+class DelayHistory:
+    """
+    Serie per treno (ritardo da andamentoTreno a ogni poll) e per fermata
+    (“treno|stazione”, ritardo registrato una volta al giorno quando la
+    fermata è raggiunta). Le statistiche del treno contano le fermate
+    raggiunte, una volta per giorno di servizio.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._store  = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self.trains: dict[str, DelaySeries] = {}
+        self.stops:  dict[str, DelaySeries] = {}
+
+    async def async_load(self) -> None:
+        stored = await self._store.async_load() or {}
+        try:
+            self.trains = {
+                k: DelaySeries.from_dict(v, TRAIN_RING)
+                for k, v in stored.get("trains", {}).items()
+            }
+            self.stops = {
+                k: DelaySeries.from_dict(v, STOP_RING)
+                for k, v in stored.get("stops", {}).items()
+            }
+        except (KeyError, TypeError, ValueError) as err:
+            _LOGGER.warning("Storico ritardi illeggibile, si riparte da zero: %s", err)
+            self.trains, self.stops = {}, {}
+
+        # treni non più seguiti da mesi: via, lo storico non cresce all'infinito
+        horizon = datetime.now().timestamp() // 60 - MAX_IDLE_DAYS * 24 * 60
+        for series in (self.trains, self.stops):
+            for key in [k for k, v in series.items() if v.last_minute() < horizon]:
+                del series[key]
+
+    @callback
+    def async_observe(self, train_number: str, snapshot: TrainSnapshot) -> None:
+        """Registra uno snapshot appena scaricato dal tracker."""
+        delay = _as_int(snapshot.ritardo)
+        if delay is None:
+            return
+        now     = datetime.now(_TZ)        # giorno di servizio di Roma, non dell'host
+        day     = now.toordinal()
+        weekday = now.weekday()
+
+        train = self.trains.get(train_number)
+        if train is None:
+            train = self.trains[train_number] = DelaySeries(TRAIN_RING)
+        train.append(int(now.timestamp() // 60), delay)
+
+        for fermata in snapshot.fermate:
+            if not fermata.arrivato:
+                continue
+            stop_delay = _as_int(fermata.ritardo)
+            if stop_delay is None:
+                continue
+            key  = _stop_key(train_number, fermata.stazione)
+            stop = self.stops.get(key)
+            if stop is None:
+                stop = self.stops[key] = DelaySeries(STOP_RING)
+            if stop.last_day == day:
+                continue
+            stop.last_day = day
+            stop.append(int(now.timestamp() // 60), stop_delay)
+            stop.stats.add(weekday, stop_delay)
+            train.stats.add(weekday, stop_delay)
+
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    def statistics(self, train_number: str, station: str | None = None) -> dict:
+        """Puntualità complessiva e per giorno della settimana."""
+        series = (
+            self.stops.get(_stop_key(train_number, station)) if station
+            else self.trains.get(train_number)
+        )
+        if series is None:
+            return {"campioni": 0}
+        return {
+            **series.stats.summary(),
+            "per_giorno": {
+                name: series.stats.summary(d) for d, name in enumerate(WEEKDAYS)
+            },
+            "ultimi_ritardi": [d for _, d in series.samples()[-20:]],
+        }
+
+    def summary(self, train_number: str) -> dict:
+        """Riepilogo breve per gli attributi del sensore."""
+        series = self.trains.get(train_number)
+        return series.stats.summary() if series else {"campioni": 0}
+
+    async def async_flush(self) -> None:
+        """Salva subito, senza attendere il salvataggio ritardato."""
+        await self._store.async_save(self._data_to_save())
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {
+            "trains": {k: v.as_dict() for k, v in self.trains.items()},
+            "stops":  {k: v.as_dict() for k, v in self.stops.items()},
+        }
+
+
+async def async_get_history(hass: HomeAssistant) -> DelayHistory:
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    history = domain_data.get(DATA_HISTORY)
+    if history is None:
+        history = DelayHistory(hass)
+        await history.async_load()
+        domain_data[DATA_HISTORY] = history
+    return history
@@ -0,0 +1,255 @@
+"""Scheduler unico a tick allineati per tutti i coordinator MyTreno."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+from datetime import timedelta
+import logging
+import math
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_at
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+TICK_SECONDS   = 15                      # le scadenze si arrotondano al tick successivo
+TICK_BUDGET    = 6                       # aggiornamenti per tick, il resto slitta
+RETRY_INTERVAL = timedelta(minutes=1)    # dopo un aggiornamento fallito
+
+
+class _Job:
+    __slots__ = ("coordinator", "interval", "due", "done", "remove_listener")
+
+    def __init__(
+        self,
+        coordinator: DataUpdateCoordinator,
+        interval: Callable[[Any], timedelta | None],
+        due: float,
+    ) -> None:
+        self.coordinator = coordinator
+        self.interval    = interval
+        self.due         = due
+        # presente finché un aggiornamento è in volo (fetch + commit)
+        self.done: asyncio.Event | None = None
+        self.remove_listener: CALLBACK_TYPE | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.done is not None
+
+
+class HubScheduler:
+    """
+    Un solo timer per tutti i coordinator (tabelloni e tracker treni).
+
+    I coordinator vengono creati con update_interval=None; ogni job ha una
+    scadenza calcolata da `interval(data)` e le scadenze sono arrotondate
+    al multiplo di TICK_SECONDS successivo, così che job vicini nel tempo
+    partano insieme. A ogni tick:
+      1. si scaricano in parallelo i job scaduti, al più `budget`
+         (i più in ritardo per primi, gli altri al tick dopo)
+      2. si pubblicano tutti i risultati in un solo passaggio, senza await
+         in mezzo: le entità scrivono lo stato nello stesso giro del loop
+    I refresh a mano (servizi) passano da `async_refresh`: mai due
+    aggiornamenti dello stesso coordinator in parallelo.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        tick: float = TICK_SECONDS,
+        budget: int = TICK_BUDGET,
+    ) -> None:
+        self.hass    = hass
+        self._tick   = tick
+        self._budget = budget
+        self._jobs:  dict[str, _Job] = {}
+        self._unsub_tick: CALLBACK_TYPE | None = None
+        self._tick_at = math.inf
+        self._stopped = False
+        self.ticks = 0
+
+    @callback
+    def async_register(
+        self,
+        name: str,
+        coordinator: DataUpdateCoordinator,
+        interval: Callable[[Any], timedelta | None],
+        first_in: float | None = None,
+    ) -> CALLBACK_TYPE:
+        """
+        Aggiunge un coordinator; `first_in` secondi al primo aggiornamento
+        (None = calcolato dai dati già presenti). Ritorna la funzione che lo toglie.
+        Lo stesso `name` sostituisce il job precedente, sganciandone il listener.
+        """
+        if (old := self._jobs.pop(name, None)) is not None:
+            _LOGGER.debug("Hub: job %s registrato di nuovo, sostituito", name)
+            old.remove_listener()
+        now = self.hass.loop.time()
+        job = _Job(coordinator, interval, math.inf)
+        job.due = now + first_in if first_in is not None else self._next_due(job, now)
+        job.remove_listener = coordinator.async_add_listener(
+            lambda: self._async_coordinator_updated(name)
+        )
+        self._jobs[name] = job
+        self._async_schedule()
+
+        @callback
+        def _remove() -> None:
+            if self._jobs.get(name) is job:
+                del self._jobs[name]
+                job.remove_listener()
+                self._async_schedule()
+
+        return _remove
+
+    @callback
+    def async_schedule(self, name: str, delay: float = 0) -> None:
+        """Anticipa un job (mai posticipa)."""
+        job = self._jobs.get(name)
+        if job is not None:
+            job.due = min(job.due, self.hass.loop.time() + delay)
+            self._async_schedule()
+
+    async def async_refresh(self, name: str) -> None:
+        """
+        Aggiorna subito un job. Se un tick lo sta già aggiornando se ne
+        attende il commit e poi si riparte: il dato pubblicato è sempre
+        il più recente e i due fetch non si sovrappongono.
+        """
+        while (job := self._jobs.get(name)) is not None and job.done is not None:
+            await job.done.wait()
+        if job is None:
+            return
+        done = job.done = asyncio.Event()
+        self._async_schedule()
+        try:
+            try:
+                result = await job.coordinator.update_method()
+            except Exception as err:  # come nel tick: errore sul coordinator
+                result = err
+            job.done = None
+            if self._jobs.get(name) is job:
+                self._async_commit(job, result, self.hass.loop.time())
+                self._async_schedule()
+        finally:
+            if job.done is done:
+                job.done = None
+            done.set()
+
+    @callback
+    def async_start(self) -> None:
+        self._stopped = False
+        self._async_schedule()
+
+    @callback
+    def async_stop(self) -> None:
+        """Nessun tick finché non si riparte (job e scadenze restano)."""
+        self._stopped = True
+        self._async_cancel_tick()
+
+    def next_tick_in(self) -> float | None:
+        """Secondi al prossimo tick (diagnostica)."""
+        if self._tick_at == math.inf:
+            return None
+        return round(max(0.0, self._tick_at - self.hass.loop.time()), 1)
+
+    # ─────────────────────────────────────────────────────────────────────
+    def _next_due(self, job: _Job, now: float) -> float:
+        coordinator = job.coordinator
+        if not coordinator.last_update_success:
+            return now + RETRY_INTERVAL.total_seconds()
+        interval = job.interval(coordinator.data)
+        return now + interval.total_seconds() if interval else math.inf
+
+    @callback
+    def _async_coordinator_updated(self, name: str) -> None:
+        job = self._jobs.get(name)
+        if job is None or job.running:     # durante il tick ci pensa il commit
+            return
+        job.due = self._next_due(job, self.hass.loop.time())
+        self._async_schedule()
+
+    @callback
+    def _async_cancel_tick(self) -> None:
+        if self._unsub_tick is not None:
+            self._unsub_tick()
+            self._unsub_tick = None
+        self._tick_at = math.inf
+
+    @callback
+    def _async_schedule(self) -> None:
+        """Timer sul tick allineato che segue la prima scadenza."""
+        if self._stopped:
+            return
+        next_due = min(
+            (job.due for job in self._jobs.values() if not job.running),
+            default=math.inf,
+        )
+        if next_due == math.inf:
+            self._async_cancel_tick()
+            return
+        # sempre su un confine di tick futuro: i job oltre budget slittano davvero
+        now     = self.hass.loop.time()
+        tick_at = math.ceil(max(next_due, now) / self._tick) * self._tick
+        if tick_at <= now:
+            tick_at += self._tick
+        if tick_at == self._tick_at:
+            return
+        self._async_cancel_tick()
+        self._tick_at    = tick_at
+        self._unsub_tick = async_call_at(self.hass, self._async_tick, tick_at)
+
+    async def _async_tick(self, _now: Any = None) -> None:
+        # il timer può scattare un soffio prima del confine: conta il confine
+        now = max(self.hass.loop.time(), self._tick_at)
+        self._unsub_tick = None
+        self._tick_at    = math.inf
+        self.ticks      += 1
+
+        due = sorted(
+            (
+                (name, job) for name, job in self._jobs.items()
+                if job.due <= now and not job.running
+            ),
+            key=lambda item: item[1].due,
+        )
+        batch = due[: self._budget]
+        if len(due) > len(batch):
+            _LOGGER.debug(
+                "Tick: %d aggiornamenti rimandati per budget", len(due) - len(batch)
+            )
+        for _, job in batch:
+            job.done = asyncio.Event()
+        self._async_schedule()     # i job rimandati al prossimo tick
+
+        finished = [job.done for _, job in batch]
+        try:
+            results = await asyncio.gather(
+                *(job.coordinator.update_method() for _, job in batch),
+                return_exceptions=True,
+            )
+
+            # commit in un solo passaggio
+            now = self.hass.loop.time()
+            for (name, job), result in zip(batch, results):
+                job.done = None
+                if self._jobs.get(name) is job:   # non tolto durante il fetch
+                    self._async_commit(job, result, now)
+            self._async_schedule()
+        finally:
+            for (_, job), done in zip(batch, finished):
+                if job.done is done:
+                    job.done = None
+                done.set()
+
+    @callback
+    def _async_commit(self, job: _Job, result: Any, now: float) -> None:
+        if isinstance(result, BaseException):
+            job.coordinator.async_set_update_error(result)
+            job.due = now + RETRY_INTERVAL.total_seconds()
+        else:
+            job.coordinator.async_set_updated_data(result)
+            job.due = self._next_due(job, now)
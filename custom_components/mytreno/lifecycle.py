@@ -0,0 +1,173 @@
+"""Ciclo di vita degli oggetti condivisi fra le config entry."""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+import logging
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_call_later
+
+from .catalog import async_get_catalog
+from .client import async_close_client
+from .const import (
+    DATA_CATALOG,
+    DATA_HISTORY,
+    DATA_PREFETCH,
+    DATA_RESOURCES,
+    DATA_STATIONS,
+    DATA_STORE,
+    DATA_TRACKER,
+    DOMAIN,
+    SIGNAL_SHARED_HOST,
+)
+from .history import async_get_history
+from .hub import HubScheduler
+from .storage import async_get_store
+from .tracker import TrainTracker
+
+_LOGGER = logging.getLogger(__name__)
+
+RELEASE_GRACE = 30   # secondi: un reload dell'ultima entry ritrova tutto vivo
+TRACKER_JOB   = "tracker"
+
+# oggetti liberati allo smontaggio (il client ha una chiusura sua)
+_SHARED_KEYS = (
+    DATA_PREFETCH, DATA_TRACKER, DATA_STATIONS, DATA_CATALOG, DATA_HISTORY, DATA_STORE,
+)
+
+
+class SharedResources:
+    """
+    Conteggio dei riferimenti sugli oggetti condivisi fra le config entry:
+    client e sessione HTTP, store, storico, catalogo stazioni, tracker, hub,
+    prefetch e servizi.
+
+    - la prima entry caricata li crea, o riprende quelli ancora vivi
+    - i sensori condivisi (treno selezionato, diagnostica, treni aggiunti
+      col servizio) stanno sulla piattaforma di una sola entry, l'“ospite”;
+      se questa viene scaricata subentra un'altra entry ancora caricata
+    - l'ultima entry scaricata ferma subito polling e prefetch; il resto
+      (salvataggio, chiusura sessione, memoria) viene smontato dopo
+      RELEASE_GRACE secondi, così un reload non ricrea nulla; una entry
+      caricata mentre lo smontaggio è già in corso ne attende la fine
+    - le entry si caricano in parallelo: async_acquire è serializzato, così
+      store, storico, catalogo e tracker vengono creati una volta sola
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self.entries: set[str] = set()
+        self.host:    str | None = None
+        self.tracker: TrainTracker | None = None
+        self.hub = HubScheduler(hass)
+        self._cancel_teardown: CALLBACK_TYPE | None = None
+        self._teardown_done:   asyncio.Event | None = None   # smontaggio in corso
+        self._remove_tracker_job: CALLBACK_TYPE | None = None
+        self._acquire_lock = asyncio.Lock()
+
+    async def async_acquire(self, entry_id: str) -> bool:
+        """Registra una entry; True se è la prima (servizi da registrare)."""
+        async with self._acquire_lock:
+            return await self._async_acquire(entry_id)
+
+    async def _async_acquire(self, entry_id: str) -> bool:
+        if self._cancel_teardown is not None:
+            self._cancel_teardown()
+            self._cancel_teardown = None
+        if self._teardown_done is not None:
+            # smontaggio già partito: si lascia finire e si ricrea tutto
+            await self._teardown_done.wait()
+        self.hass.data.setdefault(DOMAIN, {})[DATA_RESOURCES] = self
+        first = not self.entries
+        self.entries.add(entry_id)
+
+        store   = await async_get_store(self.hass)
+        history = await async_get_history(self.hass)
+        if self.tracker is None:
+            self.tracker = TrainTracker(self.hass, store, history)
+            self.tracker.async_restore()
+            self.hass.data[DOMAIN][DATA_TRACKER] = self.tracker
+            # primo giro deciso dalle piattaforme (async_schedule)
+            self._remove_tracker_job = self.hub.async_register(
+                TRACKER_JOB,
+                self.tracker.coordinator,
+                lambda _: self.tracker.next_interval,
+            )
+        self.hub.async_start()
+        # aggiornamento del catalogo solo in background, mai in attesa qui
+        (await async_get_catalog(self.hass)).async_start()
+        return first
+
+    @callback
+    def async_claim_host(self, entry_id: str) -> bool:
+        """True se `entry_id` diventa l'ospite dei sensori condivisi."""
+        if self.host is not None or entry_id not in self.entries:
+            return False
+        self.host = entry_id
+        return True
+
+    @callback
+    def async_release(self, entry_id: str) -> bool:
+        """Rilascia una entry; True se era l'ultima (servizi da togliere)."""
+        self.entries.discard(entry_id)
+        if self.host == entry_id:
+            self.host = None
+            if self.entries:
+                async_dispatcher_send(self.hass, SIGNAL_SHARED_HOST)
+        if self.entries:
+            return False
+
+        # niente più tick, prefetch né catalogo da subito
+        self.hub.async_stop()
+        if (catalog := self.hass.data[DOMAIN].get(DATA_CATALOG)) is not None:
+            catalog.async_stop()
+        prefetcher = self.hass.data[DOMAIN].get(DATA_PREFETCH)
+        if prefetcher is not None:
+            prefetcher.async_cancel()
+        self._cancel_teardown = async_call_later(
+            self.hass, RELEASE_GRACE, self._async_teardown
+        )
+        return True
+
+    async def _async_teardown(self, _now: datetime | None = None) -> None:
+        self._cancel_teardown = None
+        if self.entries:
+            return
+        _LOGGER.debug("Nessuna entry MyTreno caricata: smontaggio oggetti condivisi")
+        # da qui una nuova entry aspetta la fine (async_acquire) invece di
+        # ritrovarsi oggetti tolti da sotto durante gli await
+        self._teardown_done = asyncio.Event()
+        try:
+            await self._async_dismantle()
+        finally:
+            self._teardown_done.set()
+            self._teardown_done = None
+
+    async def _async_dismantle(self) -> None:
+        domain_data = self.hass.data[DOMAIN]
+        if self._remove_tracker_job is not None:
+            self._remove_tracker_job()
+            self._remove_tracker_job = None
+        if self.tracker is not None:
+            await self.tracker.coordinator.async_shutdown()
+
+        # ultimo salvataggio finché tracker e client sono ancora raggiungibili
+        for key in (DATA_STORE, DATA_HISTORY, DATA_CATALOG):
+            if (saved := domain_data.get(key)) is not None:
+                await saved.async_flush()
+        await async_close_client(self.hass)
+
+        for key in _SHARED_KEYS:
+            domain_data.pop(key, None)
+        self.tracker = None
+        domain_data.pop(DATA_RESOURCES, None)
+
+
+def get_resources(hass: HomeAssistant) -> SharedResources:
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    resources = domain_data.get(DATA_RESOURCES)
+    if resources is None:
+        resources = domain_data[DATA_RESOURCES] = SharedResources(hass)
+    return resources
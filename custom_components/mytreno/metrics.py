@@ -0,0 +1,204 @@
+"""Contatori e istogrammi leggeri sul percorso caldo (client e coordinator)."""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+import math
+import time
+
+# limiti superiori dei bucket di latenza (ms); l'ultimo raccoglie il resto
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+LATENCY_WINDOW     = 100    # ultime latenze tenute per i percentili “recenti”
+
+
+class Histogram:
+    """Istogramma a bucket fissi: O(1) in memoria, percentili approssimati."""
+
+    __slots__ = ("counts", "total", "sum", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.total  = 0
+        self.sum    = 0.0
+        self.max    = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        self.total += 1
+        self.sum   += value_ms
+        self.max    = max(self.max, value_ms)
+
+    def percentile(self, q: float) -> float | None:
+        """Limite superiore del bucket che contiene il quantile q (0–1)."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return self.max if bound == math.inf else bound
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count":   self.total,
+            "mean_ms": round(self.sum / self.total, 1) if self.total else None,
+            "p50_ms":  self.percentile(0.5),
+            "p95_ms":  self.percentile(0.95),
+            "max_ms":  round(self.max, 1),
+            "buckets": {
+                ("inf" if b == math.inf else str(b)): c
+                for b, c in zip(LATENCY_BUCKETS_MS, self.counts)
+            },
+        }
+
+
+class LatencyWindow:
+    """
+    Ultime LATENCY_WINDOW latenze in un ring su array: percentili esatti
+    e recenti (l'istogramma a bucket è cumulativo e troppo grossolano
+    per decidere quando duplicare una richiesta).
+    """
+
+    __slots__ = ("values", "pos", "count", "_sorted")
+
+    def __init__(self, size: int = LATENCY_WINDOW) -> None:
+        self.values  = array("f", bytes(4 * size))
+        self.pos     = 0
+        self.count   = 0
+        self._sorted: list[float] | None = None
+
+    def observe(self, value_ms: float) -> None:
+        self.values[self.pos] = value_ms
+        self.pos     = (self.pos + 1) % len(self.values)
+        self.count   = min(self.count + 1, len(self.values))
+        self._sorted = None
+
+    def percentile(self, q: float) -> float | None:
+        """Quantile q (0–1) sulla finestra; ordinata una volta per osservazione."""
+        if not self.count:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.values[: self.count])
+        rank = min(self.count - 1, max(0, math.ceil(q * self.count) - 1))
+        return round(self._sorted[rank], 1)
+
+
+class EndpointStats:
+    """Statistiche di un endpoint ViaggiaTreno."""
+
+    __slots__ = (
+        "latency", "recent", "errors", "timeouts", "http_errors", "bytes",
+        "cache_hits", "coalesced", "stale_served", "rejected",
+        "hedged", "hedge_wins",
+    )
+
+    def __init__(self) -> None:
+        self.latency      = Histogram()
+        self.recent       = LatencyWindow()
+        self.errors       = 0   # eccezioni di trasporto
+        self.timeouts     = 0
+        self.http_errors  = 0   # risposte != 200
+        self.bytes        = 0
+        self.cache_hits   = 0
+        self.coalesced    = 0   # richieste agganciate a una già in volo
+        self.stale_served = 0   # dato scaduto servito a circuito aperto
+        self.rejected     = 0   # circuito aperto, nessun dato
+        self.hedged       = 0   # richieste duplicate dopo il p95 recente
+        self.hedge_wins   = 0   # … in cui il duplicato ha risposto per primo
+
+    @property
+    def requests(self) -> int:
+        return self.latency.total + self.errors + self.timeouts
+
+    def as_dict(self) -> dict:
+        served = self.requests + self.cache_hits + self.coalesced
+        return {
+            "requests":       self.requests,
+            "errors":         self.errors,
+            "timeouts":       self.timeouts,
+            "http_errors":    self.http_errors,
+            "bytes":          self.bytes,
+            "avg_bytes":      round(self.bytes / self.latency.total) if self.latency.total else None,
+            "cache_hits":     self.cache_hits,
+            "coalesced":      self.coalesced,
+            "cache_hit_rate": round((self.cache_hits + self.coalesced) / served, 3) if served else None,
+            "stale_served":   self.stale_served,
+            "rejected":       self.rejected,
+            "hedged":         self.hedged,
+            "hedge_wins":     self.hedge_wins,
+            "recent_p95_ms":  self.recent.percentile(0.95),
+            "latency":        self.latency.as_dict(),
+        }
+
+
+class UpdateStats:
+    """Durata degli aggiornamenti di un coordinator (o di un singolo treno)."""
+
+    __slots__ = ("duration", "failures", "last_ms")
+
+    def __init__(self) -> None:
+        self.duration = Histogram()
+        self.failures = 0
+        self.last_ms: float | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "failures": self.failures,
+            "last_ms":  self.last_ms,
+            **self.duration.as_dict(),
+        }
+
+
+class Metrics:
+    """Raccolta unica, appesa al client condiviso."""
+
+    def __init__(self) -> None:
+        self.endpoints: dict[str, EndpointStats] = {}
+        self.updates:   dict[str, UpdateStats]   = {}
+
+    def endpoint(self, name: str) -> EndpointStats:
+        stats = self.endpoints.get(name)
+        if stats is None:
+            stats = self.endpoints[name] = EndpointStats()
+        return stats
+
+    def update(self, name: str) -> UpdateStats:
+        stats = self.updates.get(name)
+        if stats is None:
+            stats = self.updates[name] = UpdateStats()
+        return stats
+
+    @contextmanager
+    def time_update(self, name: str):
+        """`with metrics.time_update("station_S01700"): data = await …`"""
+        stats = self.update(name)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            stats.failures += 1
+            raise
+        finally:
+            stats.last_ms = round((time.perf_counter() - start) * 1000, 1)
+            stats.duration.observe(stats.last_ms)
+
+    def total_requests(self) -> int:
+        return sum(s.requests for s in self.endpoints.values())
+
+    def slowest_updates(self, limit: int = 5) -> dict[str, float | None]:
+        """I coordinator / treni più lenti per p95."""
+        ranked = sorted(
+            self.updates.items(),
+            key=lambda kv: kv[1].duration.percentile(0.95) or 0,
+            reverse=True,
+        )
+        return {name: s.duration.percentile(0.95) for name, s in ranked[:limit]}
+
+    def as_dict(self) -> dict:
+        return {
+            "endpoints": {n: s.as_dict() for n, s in self.endpoints.items()},
+            "updates":   {n: s.as_dict() for n, s in self.updates.items()},
+        }
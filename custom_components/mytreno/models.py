@@ -0,0 +1,226 @@
+"""Modelli compatti (slots) per tabelloni, fermate, snapshot dei treni e tratte."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+STALE_KEY = "stale"    # marcatore sui dati letti da disco, tolto al primo refresh
+
+# chiave della località nel dict pubblicato, per tipo di tabellone
+PLACE_KEY = {"partenze": "destinazione", "arrivi": "provenienza"}
+
+
+@dataclass(slots=True)
+class BoardRow:
+    """Una riga di partenze o arrivi."""
+
+    treno:             str
+    orario:            str
+    localita:          str           # destinazione (partenze) / provenienza (arrivi)
+    ritardo:           Any
+    binario_previsto:  Any
+    binario_effettivo: Any
+    soppresso:         bool = False
+    numero:            int | None = None
+    cod_origine:       str | None = None
+    data_partenza:     int | None = None
+
+    def as_dict(self, kind: str) -> dict:
+        return {
+            "treno":             self.treno,
+            "orario":            self.orario,
+            PLACE_KEY[kind]:     self.localita,
+            "ritardo":           self.ritardo,
+            "binario_previsto":  self.binario_previsto,
+            "binario_effettivo": self.binario_effettivo,
+            "soppresso":         self.soppresso,
+            "numero":            self.numero,
+            "cod_origine":       self.cod_origine,
+            "data_partenza":     self.data_partenza,
+        }
+
+    @classmethod
+    def from_dict(cls, kind: str, raw: dict) -> BoardRow:
+        return cls(
+            treno=raw.get("treno", "??"),
+            orario=raw.get("orario", "??"),
+            localita=raw.get(PLACE_KEY[kind], "??"),
+            ritardo=raw.get("ritardo", "?"),
+            binario_previsto=raw.get("binario_previsto", "N/A"),
+            binario_effettivo=raw.get("binario_effettivo", "N/A"),
+            soppresso=bool(raw.get("soppresso")),
+            numero=raw.get("numero"),
+            cod_origine=raw.get("cod_origine"),
+            data_partenza=raw.get("data_partenza"),
+        )
+
+
+@dataclass(slots=True)
+class Board:
+    """Tabellone di una stazione; il dict per gli attributi si crea una volta sola."""
+
+    partenze: list[BoardRow] = field(default_factory=list)
+    arrivi:   list[BoardRow] = field(default_factory=list)
+    stale:    bool = False
+    _dict:    dict | None = field(default=None, init=False, repr=False, compare=False)
+
+    def rows(self, kind: str) -> list[BoardRow]:
+        return self.partenze if kind == "partenze" else self.arrivi
+
+    def is_empty(self) -> bool:
+        return not (self.partenze or self.arrivi)
+
+    def as_stale(self) -> Board:
+        return replace(self, stale=True)
+
+    def as_dict(self) -> dict:
+        if self._dict is None:
+            self._dict = {
+                kind: [row.as_dict(kind) for row in self.rows(kind)]
+                for kind in PLACE_KEY
+            }
+            self._dict[STALE_KEY] = self.stale
+        return self._dict
+
+    @classmethod
+    def from_dict(cls, raw: dict, stale: bool = False) -> Board:
+        return cls(
+            partenze=[BoardRow.from_dict("partenze", r) for r in raw.get("partenze") or []],
+            arrivi=[BoardRow.from_dict("arrivi", r) for r in raw.get("arrivi") or []],
+            stale=stale,
+        )
+
+
+@dataclass(slots=True)
+class Stop:
+    """Una fermata dell'itinerario (tratteCanvas)."""
+
+    stazione:    str
+    programmata: str | None
+    effettiva:   str | None
+    ritardo:     Any
+    arrivato:    bool
+    binario:     Any
+
+    def as_dict(self) -> dict:
+        return {
+            "stazione":    self.stazione,
+            "programmata": self.programmata,
+            "effettiva":   self.effettiva,
+            "ritardo":     self.ritardo,
+            "arrivato":    self.arrivato,
+            "binario":     self.binario,
+        }
+
+    @classmethod
+    def from_dict(cls, raw: dict) -> Stop:
+        return cls(
+            stazione=raw.get("stazione", "--"),
+            programmata=raw.get("programmata"),
+            effettiva=raw.get("effettiva"),
+            ritardo=raw.get("ritardo", 0),
+            arrivato=bool(raw.get("arrivato")),
+            binario=raw.get("binario"),
+        )
+
+
+@dataclass(slots=True)
+class TrainSnapshot:
+    """Stato di un treno a un dato poll (andamentoTreno + tratteCanvas)."""
+
+    train_number:             str
+    ritardo:                  Any
+    stato:                    Any
+    ultima_stazione:          str
+    ora_ultimo_rilevamento:   str | None
+    prossima_stazione:        str | None
+    orario_previsto_prossima: str | None
+    soppresso:                bool
+    fermate:                  tuple[Stop, ...] = ()
+    stale:                    bool = False
+    _dict: dict | None = field(default=None, init=False, repr=False, compare=False)
+
+    def as_stale(self) -> TrainSnapshot:
+        return replace(self, stale=True)
+
+    def as_dict(self) -> dict:
+        if self._dict is None:
+            self._dict = {
+                "train_number":             self.train_number,
+                "ritardo":                  self.ritardo,
+                "stato":                    self.stato,
+                "ultima_stazione":          self.ultima_stazione,
+                "ora_ultimo_rilevamento":   self.ora_ultimo_rilevamento,
+                "prossima_stazione":        self.prossima_stazione,
+                "orario_previsto_prossima": self.orario_previsto_prossima,
+                "soppresso":                self.soppresso,
+                "fermate":                  [f.as_dict() for f in self.fermate],
+                STALE_KEY:                  self.stale,
+            }
+        return self._dict
+
+    @classmethod
+    def from_dict(cls, raw: dict, stale: bool = False) -> TrainSnapshot:
+        return cls(
+            train_number=str(raw.get("train_number", "")),
+            ritardo=raw.get("ritardo", 0),
+            stato=raw.get("stato"),
+            ultima_stazione=raw.get("ultima_stazione", "--"),
+            ora_ultimo_rilevamento=raw.get("ora_ultimo_rilevamento"),
+            prossima_stazione=raw.get("prossima_stazione"),
+            orario_previsto_prossima=raw.get("orario_previsto_prossima"),
+            soppresso=bool(raw.get("soppresso")),
+            fermate=tuple(Stop.from_dict(f) for f in raw.get("fermate") or []),
+            stale=stale,
+        )
+
+
+@dataclass(slots=True)
+class CommuteRow:
+    """Un treno da A che ferma anche in B."""
+
+    treno:        str
+    orario:       str
+    destinazione: str            # capolinea del treno
+    arrivo:       str | None     # orario programmato in B (HH:MM)
+    ritardo:      Any
+    binario:      Any
+    soppresso:    bool = False
+    numero:       int | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "treno":        self.treno,
+            "orario":       self.orario,
+            "destinazione": self.destinazione,
+            "arrivo":       self.arrivo,
+            "ritardo":      self.ritardo,
+            "binario":      self.binario,
+            "soppresso":    self.soppresso,
+            "numero":       self.numero,
+        }
+
+
+@dataclass(slots=True)
+class Commute:
+    """
+    Prossimi treni da una stazione a un'altra. `partial`: qualche treno in
+    testa al tabellone non è stato valutato (itinerario non ancora scaricato).
+    """
+
+    treni:   list[CommuteRow] = field(default_factory=list)
+    stale:   bool = False
+    partial: bool = False
+    _dict:   dict | None = field(default=None, init=False, repr=False, compare=False)
+
+    def is_empty(self) -> bool:
+        return not self.treni
+
+    def as_dict(self) -> dict:
+        if self._dict is None:
+            self._dict = {
+                "treni":    [t.as_dict() for t in self.treni],
+                "parziale": self.partial,
+                STALE_KEY:  self.stale,
+            }
+        return self._dict
@@ -0,0 +1,119 @@
+"""Prefetch in background dei treni in testa ai tabelloni."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+import logging
+import time
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DATA_PREFETCH, DOMAIN
+from .governor import NoTokenError
+from .models import Board, TrainSnapshot
+from .utils import fetch_train_data, seed_train_resolution
+
+_LOGGER = logging.getLogger(__name__)
+
+PREFETCH_BUDGET  = 30      # treni scaricabili per finestra
+PREFETCH_WINDOW  = 600     # secondi
+PREFETCH_PAUSE   = 1.0     # pausa fra un treno e l'altro: bassa priorità
+SNAPSHOT_TTL     = 300     # secondi di validità di uno snapshot prefetchato
+_MAX_SNAPSHOTS   = 200
+
+
+class Prefetcher:
+    """
+    Scalda risoluzione e itinerario dei primi N treni di ogni tabellone,
+    uno alla volta e dentro un budget di richieste, così che selezionare
+    un treno dalla card (set_train) mostri subito i dati. Le richieste sono
+    facoltative: solo con token liberi, mai in coda davanti al polling.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._queue: dict[str, tuple[str | None, int | None]] = {}
+        self._spent: deque[float] = deque()
+        self._snapshots: dict[str, tuple[float, TrainSnapshot]] = {}
+        self._task: asyncio.Task | None = None
+
+    @callback
+    def async_schedule(self, board: Board, limit: int) -> None:
+        """Accoda i primi `limit` treni di partenze e arrivi."""
+        for kind in ("partenze", "arrivi"):
+            for row in board.rows(kind)[:limit]:
+                if row.numero is None or row.soppresso:
+                    continue
+                tn = str(row.numero)
+                if tn in self._queue or self.snapshot(tn):
+                    continue
+                self._queue[tn] = (row.cod_origine, row.data_partenza)
+
+        if self._queue and (self._task is None or self._task.done()):
+            self._task = self.hass.async_create_background_task(
+                self._async_run(), "mytreno_prefetch"
+            )
+
+    def snapshot(self, train_number: str) -> TrainSnapshot | None:
+        """Snapshot prefetchato ancora valido, se c'è."""
+        entry = self._snapshots.get(train_number)
+        if entry and time.monotonic() - entry[0] < SNAPSHOT_TTL:
+            return entry[1]
+        return None
+
+    @callback
+    def async_cancel(self) -> None:
+        self._queue.clear()
+        if self._task is not None:
+            self._task.cancel()
+
+    # ─────────────────────────────────────────────────────────────────────
+    def _budget_left(self) -> bool:
+        limit = time.monotonic() - PREFETCH_WINDOW
+        while self._spent and self._spent[0] < limit:
+            self._spent.popleft()
+        return len(self._spent) < PREFETCH_BUDGET
+
+    async def _async_run(self) -> None:
+        while self._queue:
+            if not self._budget_left():
+                _LOGGER.debug(
+                    "Prefetch: budget esaurito, %d treni rimandati", len(self._queue)
+                )
+                self._queue.clear()      # li riproporrà il prossimo tabellone
+                return
+
+            tn, (origin, ts) = next(iter(self._queue.items()))
+            del self._queue[tn]
+            if origin and ts:
+                seed_train_resolution(self.hass, tn, origin, ts)
+
+            self._spent.append(time.monotonic())
+            try:
+                data = await fetch_train_data(self.hass, tn, origin, optional=True)
+            except NoTokenError:
+                # token bucket occupato dal polling: si lascia stare il
+                # giro, li riproporrà il prossimo tabellone
+                self._spent.pop()
+                _LOGGER.debug(
+                    "Prefetch: nessun token libero, %d treni rimandati",
+                    len(self._queue) + 1,
+                )
+                self._queue.clear()
+                return
+            except Exception as err:  # best effort: si riproverà
+                _LOGGER.debug("Prefetch treno %s fallito: %s", tn, err)
+            else:
+                self._snapshots[tn] = (time.monotonic(), data)
+                if len(self._snapshots) > _MAX_SNAPSHOTS:
+                    oldest = min(self._snapshots, key=lambda k: self._snapshots[k][0])
+                    del self._snapshots[oldest]
+            await asyncio.sleep(PREFETCH_PAUSE)
+
+
+def get_prefetcher(hass: HomeAssistant) -> Prefetcher:
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    prefetcher = domain_data.get(DATA_PREFETCH)
+    if prefetcher is None:
+        prefetcher = domain_data[DATA_PREFETCH] = Prefetcher(hass)
+    return prefetcher
@@ -0,0 +1,104 @@
+"""Intervalli di polling adattivi, calcolati dai dati già scaricati."""
+from __future__ import annotations
+
+from datetime import datetime, time, timedelta
+
+from .hub import TICK_SECONDS
+from .models import Board, Commute, TrainSnapshot
+from .utils import _TZ
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Tabelloni stazione
+# ─────────────────────────────────────────────────────────────────────────────
+STATION_DAY     = timedelta(minutes=5)
+STATION_EMPTY   = timedelta(minutes=15)   # nessun treno in tabellone
+STATION_NIGHT   = timedelta(minutes=30)
+COMMUTE_PARTIAL = timedelta(seconds=TICK_SECONDS)   # itinerari da scaricare
+NIGHT_START     = time(1, 0)
+NIGHT_END       = time(5, 0)
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Treni
+# ─────────────────────────────────────────────────────────────────────────────
+TRAIN_MOVING       = timedelta(seconds=30)   # in viaggio, rilevamenti freschi
+TRAIN_MOVING_STALE = timedelta(minutes=2)    # in viaggio, nessun rilevamento
+TRAIN_SOON         = timedelta(minutes=1)    # parte entro DEPARTURE_LEAD
+TRAIN_WAITING_MAX  = timedelta(minutes=30)   # parte fra parecchie ore
+TRAIN_WAITING_MIN  = timedelta(minutes=5)
+DETECTION_FRESH    = timedelta(minutes=15)
+DEPARTURE_LEAD     = timedelta(minutes=15)   # torna veloce 15' prima
+DEPARTURE_GRACE    = timedelta(minutes=60)   # oltre, partenza senza rilevamenti: lento
+SERVICE_DAY_START  = time(3, 0)              # riprova il giorno dopo
+
+
+def _now() -> datetime:
+    return datetime.now(_TZ)
+
+
+def _parse_iso(value: str | None) -> datetime | None:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_night(now: datetime | None = None) -> bool:
+    now = now or _now()
+    return NIGHT_START <= now.time() < NIGHT_END
+
+
+def station_interval(
+    data: Board | Commute | None, now: datetime | None = None
+) -> timedelta:
+    """
+    Intervallo per un tabellone (o una tratta): lento di notte o se vuoto;
+    una tratta parziale si completa subito, al tick dopo.
+    """
+    if isinstance(data, Commute) and data.partial:
+        return COMMUTE_PARTIAL
+    if is_night(now):
+        return STATION_NIGHT
+    if data is None or data.is_empty():
+        return STATION_EMPTY
+    return STATION_DAY
+
+
+def train_interval(
+    data: TrainSnapshot | None, now: datetime | None = None
+) -> timedelta | None:
+    """
+    Intervallo per un treno in base al suo stato:
+      - nessun treno                → None (solo refresh su richiesta)
+      - in viaggio                  → 30 s (2 min se i rilevamenti tacciono)
+      - non ancora partito          → lento, accelera DEPARTURE_LEAD prima
+      - partito da DEPARTURE_GRACE ma nessuna fermata raggiunta → 30 min
+      - arrivato al capolinea o soppresso → fermo fino al giorno di servizio dopo
+    """
+    if data is None:
+        return None
+    now = now or _now()
+    fermate = data.fermate
+
+    # arrivato (ultima fermata raggiunta) o soppresso: niente da seguire oggi
+    if data.soppresso or (fermate and fermate[-1].arrivato):
+        resume = datetime.combine(now.date(), SERVICE_DAY_START, now.tzinfo)
+        if resume <= now:
+            resume += timedelta(days=1)
+        return resume - now
+
+    if any(f.arrivato for f in fermate):
+        last = _parse_iso(data.ora_ultimo_rilevamento)
+        if last and now - last <= DETECTION_FRESH:
+            return TRAIN_MOVING
+        return TRAIN_MOVING_STALE
+
+    departure = _parse_iso(fermate[0].programmata) if fermate else None
+    if departure is None:
+        return TRAIN_MOVING_STALE
+    if now - departure > DEPARTURE_GRACE:
+        # doveva essere partito da un pezzo e non risulta: non martellare
+        return TRAIN_WAITING_MAX
+    wait = departure - now - DEPARTURE_LEAD
+    if wait <= timedelta(0):
+        return TRAIN_SOON
+    return max(TRAIN_WAITING_MIN, min(wait, TRAIN_WAITING_MAX))
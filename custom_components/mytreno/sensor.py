@@ -3,8 +3,12 @@ from __future__ import annotations
 from datetime import timedelta
 import logging
 
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.update_coordinator import (
     DataUpdateCoordinator,
     CoordinatorEntity,
@@ -12,19 +16,100 @@ from homeassistant.helpers.update_coordinator import (
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.entity import generate_entity_id
 
-from .const import DOMAIN
-from .utils import fetch_data, fetch_train_data
+from .const import (
+    CONF_PREFETCH,
+    DOMAIN,
+    SIGNAL_SHARED_HOST,
+    SIGNAL_TRAIN_ADDED,
+    SIGNAL_TRAIN_REMOVED,
+)
+from .client import ViaggiaTrenoClient, get_client
+from .events import diff_board, fire_events
+from .governor import startup_delay
+from .lifecycle import TRACKER_JOB, get_resources
+from .models import Board, Commute, TrainSnapshot
+from .prefetch import get_prefetcher
+from .scheduler import station_interval
+from .storage import async_get_store
+from .tracker import TrainTracker
+from .utils import BoardConfig, fetch_commute, fetch_data
 
 _LOGGER = logging.getLogger(__name__)
 ENTITY_ID_FORMAT = "sensor.mytreno_{}"
-GLOBAL_TRACK_KEY = "global_tracking"  # sensore unico “selected train”
+SCAN_INTERVAL = timedelta(seconds=60)   # solo i sensori di diagnostica fanno polling
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Attributi compatti: riepilogo registrato, liste pesanti solo per la card
+#  (i modelli diventano dict solo qui, quando l'entità pubblica)
+# ─────────────────────────────────────────────────────────────────────────────
+def _station_attributes(data: Board | None) -> dict:
+    if data is None:
+        return {}
+    attrs = dict(data.as_dict())
+    for kind, key in (("partenze", "prossima_partenza"), ("arrivi", "prossimo_arrivo")):
+        rows = data.rows(kind)
+        attrs[f"numero_{kind}"] = len(rows)
+        attrs[key] = f"{rows[0].orario} {rows[0].treno}" if rows else None
+    return attrs
+
+
+def _train_attributes(
+    data: TrainSnapshot | None, puntualita: dict | None = None
+) -> dict:
+    if data is None:
+        return {}
+    return {
+        **data.as_dict(),
+        "fermate_totali":    len(data.fermate),
+        "fermate_effettuate": sum(1 for f in data.fermate if f.arrivato),
+        "puntualita":        puntualita or {"campioni": 0},
+    }
+
+
+def _commute_attributes(data: Commute | None) -> dict:
+    if data is None:
+        return {}
+    first = data.treni[0] if data.treni else None
+    return {
+        **data.as_dict(),
+        "numero_treni":   len(data.treni),
+        "prossimo_treno": f"{first.orario} {first.treno}" if first else None,
+        "arrivo":         first.arrivo if first else None,
+    }
+
+
+def _delay(data: TrainSnapshot | None):
+    return data.ritardo if data is not None else None
+
+
+class _ChangeDetectingEntity(CoordinatorEntity):
+    """
+    Scrive lo stato solo quando quello che l'entità pubblica è cambiato:
+    il tracker aggiorna tutti i treni insieme ma di solito ne cambia uno.
+    """
+
+    _last_published = None
+
+    def _published(self):
+        return (self.available, self.state, self.extra_state_attributes)
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        published = self._published()
+        if published == self._last_published:
+            return
+        self._last_published = published
+        super()._handle_coordinator_update()
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  Entity: Tabellone stazione
 # ─────────────────────────────────────────────────────────────────────────────
-class MyTrenoStationSensor(CoordinatorEntity):
+class MyTrenoStationSensor(_ChangeDetectingEntity):
     _attr_icon = "mdi:train"
+    # le righe servono alla card ma non al recorder
+    _unrecorded_attributes = frozenset({"partenze", "arrivi"})
 
     def __init__(self, coordinator, station_id, station_name):
         super().__init__(coordinator)
@@ -48,18 +133,52 @@ class MyTrenoStationSensor(CoordinatorEntity):
 
     @property
     def extra_state_attributes(self):
-        return self.coordinator.data
+        return _station_attributes(self.coordinator.data)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Entity: Tratta da A a B (pendolare)
+# ─────────────────────────────────────────────────────────────────────────────
+class MyTrenoCommuteSensor(_ChangeDetectingEntity):
+    _attr_icon = "mdi:train-variant"
+    _unrecorded_attributes = frozenset({"treni"})
+
+    def __init__(self, coordinator, from_id, to_id, title):
+        super().__init__(coordinator)
+        self.entity_id = generate_entity_id(
+            ENTITY_ID_FORMAT, f"tratta_{from_id}_{to_id}".lower(), hass=coordinator.hass
+        )
+        self._attr_unique_id = f"{DOMAIN}_commute_{from_id}_{to_id}"
+        self._attr_name = title
+        self._attr_device_info = {
+            "identifiers": {(DOMAIN, f"{from_id}_{to_id}")},
+            "name": f"Tratta {title}",
+            "manufacturer": "Trenitalia",
+            "model": "MyTreno Commute",
+            "entry_type": "service",
+        }
+
+    @property
+    def state(self):
+        """Orario del prossimo treno utile."""
+        data = self.coordinator.data
+        return data.treni[0].orario if data is not None and data.treni else None
+
+    @property
+    def extra_state_attributes(self):
+        return _commute_attributes(self.coordinator.data)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  Entity: Treno selezionato (globale)
 # ─────────────────────────────────────────────────────────────────────────────
-class MyTrenoSelectedTrainSensor(CoordinatorEntity):
+class MyTrenoSelectedTrainSensor(_ChangeDetectingEntity):
     _attr_icon = "mdi:train-car"
+    _unrecorded_attributes = frozenset({"fermate"})
 
-    def __init__(self, coordinator, container):
-        super().__init__(coordinator)
-        self._container = container
+    def __init__(self, tracker: TrainTracker):
+        super().__init__(tracker.coordinator)
+        self._tracker = tracker
         self.entity_id = "sensor.mytreno_selected_train"
         self._attr_unique_id = f"{DOMAIN}_selected_train"
         self._attr_name = "Treno selezionato"
@@ -67,21 +186,27 @@ class MyTrenoSelectedTrainSensor(CoordinatorEntity):
 
     @property
     def state(self):
-        return self.coordinator.data.get("ritardo")
+        return _delay(self._tracker.train_data(self._tracker.selected))
 
     @property
     def extra_state_attributes(self):
-        return self.coordinator.data
+        tn = self._tracker.selected
+        return _train_attributes(
+            self._tracker.train_data(tn),
+            self._tracker.history.summary(tn) if tn else None,
+        )
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-#  Entity: Treno fisso configurato
+#  Entity: Treno fisso configurato (o aggiunto con mytreno.add_train)
 # ─────────────────────────────────────────────────────────────────────────────
-class MyTrenoStaticTrainSensor(CoordinatorEntity):
+class MyTrenoStaticTrainSensor(_ChangeDetectingEntity):
     _attr_icon = "mdi:train-car"
+    _unrecorded_attributes = frozenset({"fermate"})
 
-    def __init__(self, coordinator, train_number):
-        super().__init__(coordinator)
+    def __init__(self, tracker: TrainTracker, train_number):
+        super().__init__(tracker.coordinator)
+        self._tracker = tracker
         self.entity_id = f"sensor.mytreno_treno_{train_number}"
         self._attr_unique_id = f"{DOMAIN}_static_{train_number}"
         self._attr_name = f"Treno {train_number}"
@@ -94,13 +219,107 @@ class MyTrenoStaticTrainSensor(CoordinatorEntity):
             "entry_type": "service",
         }
 
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_TRAIN_REMOVED, self._handle_train_removed
+            )
+        )
+
+    async def async_will_remove_from_hass(self) -> None:
+        self._tracker.entities.discard(self._train_number)
+        await super().async_will_remove_from_hass()
+
+    @callback
+    def _handle_train_removed(self, train_number: str) -> None:
+        """Treno non più seguito da nessuno: via anche dal registry."""
+        if train_number != self._train_number:
+            return
+        registry = er.async_get(self.hass)
+        if registry.async_get(self.entity_id):
+            registry.async_remove(self.entity_id)
+        else:
+            self.hass.async_create_task(self.async_remove())
+
+    @property
+    def available(self):
+        return super().available and (
+            self._tracker.train_data(self._train_number) is not None
+        )
+
     @property
     def state(self):
-        return self.coordinator.data.get("ritardo")
+        return _delay(self._tracker.train_data(self._train_number))
 
     @property
     def extra_state_attributes(self):
-        return self.coordinator.data
+        return _train_attributes(
+            self._tracker.train_data(self._train_number),
+            self._tracker.history.summary(self._train_number),
+        )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Entity: diagnostica (richieste HTTP e durata aggiornamenti)
+# ─────────────────────────────────────────────────────────────────────────────
+class MyTrenoRequestsDiagnosticSensor(SensorEntity):
+    _attr_icon = "mdi:web-clock"
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _unrecorded_attributes = frozenset({"endpoints", "circuiti"})
+
+    def __init__(self, client: ViaggiaTrenoClient):
+        self._client = client
+        self.entity_id = "sensor.mytreno_richieste_http"
+        self._attr_unique_id = f"{DOMAIN}_diag_requests"
+        self._attr_name = "MyTreno richieste HTTP"
+
+    async def async_update(self) -> None:
+        metrics = self._client.metrics
+        self._attr_native_value = metrics.total_requests()
+        self._attr_extra_state_attributes = {
+            "endpoints": {
+                name: {
+                    "richieste":      stats.requests,
+                    "errori":         stats.errors + stats.http_errors,
+                    "timeout":        stats.timeouts,
+                    "cache_hit_rate": summary["cache_hit_rate"],
+                    "p95_ms":         summary["recent_p95_ms"],
+                    "duplicate":      stats.hedged,
+                    "byte_medi":      summary["avg_bytes"],
+                }
+                for name, stats in metrics.endpoints.items()
+                for summary in (stats.as_dict(),)
+            },
+            "circuiti": self._client.circuit_state(),
+        }
+
+
+class MyTrenoUpdatesDiagnosticSensor(SensorEntity):
+    _attr_icon = "mdi:timer-sand"
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _unrecorded_attributes = frozenset({"piu_lenti", "errori"})
+
+    def __init__(self, client: ViaggiaTrenoClient):
+        self._client = client
+        self.entity_id = "sensor.mytreno_durata_aggiornamenti"
+        self._attr_unique_id = f"{DOMAIN}_diag_updates"
+        self._attr_name = "MyTreno durata aggiornamenti (p95)"
+
+    async def async_update(self) -> None:
+        metrics = self._client.metrics
+        slowest = metrics.slowest_updates()
+        self._attr_native_value = next(iter(slowest.values()), None)
+        self._attr_extra_state_attributes = {
+            "piu_lenti": slowest,
+            "errori": {
+                name: stats.failures
+                for name, stats in metrics.updates.items()
+                if stats.failures
+            },
+        }
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -112,68 +331,150 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
 
+    store     = await async_get_store(hass)
+    resources = get_resources(hass)
+
     # --- STAZIONE ---
     station_id = entry.data.get("station_id")
     station_name = entry.title
 
     if station_id:
-        async def _upd_station():
-            return await fetch_data(hass, station_id)
+        metrics = get_client(hass).metrics
+        board_config = BoardConfig.from_options(entry.options)
+        prefetch     = entry.options.get(CONF_PREFETCH, 0)
 
+        async def _upd_station():
+            with metrics.time_update(f"station_{station_id}"):
+                data = await fetch_data(hass, station_id, board_config)
+            fire_events(hass, diff_board(station_id, station_coord.data, data))
+            if prefetch:
+                get_prefetcher(hass).async_schedule(data, prefetch)
+            store.async_set_board(station_id, data)
+            return data
+
+        # nessun timer proprio: lo riprogramma l'hub con station_interval()
         station_coord = DataUpdateCoordinator(
             hass,
             logger=_LOGGER,
             name=f"mytreno_station_{station_id}",
             update_method=_upd_station,
-            update_interval=timedelta(minutes=5),
+            update_interval=None,
         )
-        await station_coord.async_config_entry_first_refresh()
 
-        async_add_entities(
-            [MyTrenoStationSensor(station_coord, station_id, station_name)], True
+        cached = store.board(station_id)
+        if cached:
+            # avvio a caldo: tabellone salvato subito, dati live al primo tick
+            # dopo un ritardo casuale (niente raffica di richieste all'avvio)
+            station_coord.async_set_updated_data(cached)
+            first_in = startup_delay()
+        else:
+            await station_coord.async_config_entry_first_refresh()
+            first_in = None
+        entry.async_on_unload(
+            # job per entry: due entry della stessa stazione non si scavalcano
+            resources.hub.async_register(
+                f"station_{entry.entry_id}", station_coord, station_interval, first_in
+            )
         )
 
-    # --- TRENO SELEZIONATO GLOBALE (una sola volta) ---
-    if GLOBAL_TRACK_KEY not in hass.data.setdefault(DOMAIN, {}):
-        container = {"train_number": None}
-
-        async def _upd_train():
-            tn = container["train_number"]
-            return await fetch_train_data(hass, tn) if tn else {}
+        async_add_entities(
+            [MyTrenoStationSensor(station_coord, station_id, station_name)]
+        )
 
-        track_coord = DataUpdateCoordinator(
+    # --- TRATTA DA A A B ---
+    from_id = entry.data.get("from_station_id")
+    if from_id:
+        to_id        = entry.data["to_station_id"]
+        commute_name = f"commute_{from_id}_{to_id}"
+        metrics      = get_client(hass).metrics
+        board_config = BoardConfig.from_options(entry.options)
+
+        async def _upd_commute():
+            with metrics.time_update(commute_name):
+                return await fetch_commute(
+                    hass,
+                    from_id,
+                    entry.data.get("from_station_name", ""),
+                    to_id,
+                    entry.data.get("to_station_name", ""),
+                    board_config,
+                )
+
+        commute_coord = DataUpdateCoordinator(
             hass,
             logger=_LOGGER,
-            name="mytreno_selected_train_global",
-            update_method=_upd_train,
-            update_interval=timedelta(seconds=30),
+            name=f"mytreno_{commute_name}",
+            update_method=_upd_commute,
+            update_interval=None,
         )
-        await track_coord.async_refresh()
+        # niente attesa nel setup: il primo giro lo fa l'hub al prossimo tick
+        entry.async_on_unload(
+            resources.hub.async_register(
+                f"commute_{entry.entry_id}", commute_coord, station_interval, 0
+            )
+        )
+        async_add_entities(
+            [MyTrenoCommuteSensor(commute_coord, from_id, to_id, entry.title)]
+        )
+
+    # --- TRACKER TRENI (selezionato + fissi + da servizio), condiviso ---
+    tracker = resources.tracker
 
+    @callback
+    def _async_host_shared() -> None:
+        """Sensori condivisi su questa entry, se nessun'altra li ospita."""
+        if not resources.async_claim_host(entry.entry_id):
+            return
+        client = get_client(hass)
         async_add_entities(
-            [MyTrenoSelectedTrainSensor(track_coord, container)], True
+            [
+                MyTrenoSelectedTrainSensor(tracker),
+                MyTrenoRequestsDiagnosticSensor(client),
+                MyTrenoUpdatesDiagnosticSensor(client),
+            ]
         )
 
-        hass.data[DOMAIN][GLOBAL_TRACK_KEY] = {
-            "train_container": container,
-            "train_coordinator": track_coord,
-        }
+        @callback
+        def _handle_train_added(train_number: str) -> None:
+            _async_add_train_sensor(tracker, async_add_entities, train_number)
+
+        entry.async_on_unload(
+            async_dispatcher_connect(hass, SIGNAL_TRAIN_ADDED, _handle_train_added)
+        )
+        # anche i sensori rimasti orfani dall'ospite precedente
+        for tn in tracker.sensor_trains():
+            _handle_train_added(tn)
+
+    _async_host_shared()
+    entry.async_on_unload(
+        async_dispatcher_connect(hass, SIGNAL_SHARED_HOST, _async_host_shared)
+    )
 
     # --- TRENO FISSO CONFIGURATO ---
     train_number = entry.data.get("train_number")
     if train_number:
-        async def _upd_static():
-            return await fetch_train_data(hass, train_number)
-
-        static_coord = DataUpdateCoordinator(
-            hass,
-            logger=_LOGGER,
-            name=f"mytreno_static_train_{train_number}",
-            update_method=_upd_static,
-            update_interval=timedelta(seconds=60),
+        tracker.async_add(
+            train_number, entry.data.get("origin_station_id"), owner=entry.entry_id
         )
-        await static_coord.async_config_entry_first_refresh()
+        _async_add_train_sensor(tracker, async_add_entities, train_number)
 
-        async_add_entities(
-            [MyTrenoStaticTrainSensor(static_coord, train_number)], True
+    # aggiornamento live dei treni al prossimo tick (più entry si accorpano);
+    # se sono tutti già in cache da disco non c'è fretta: partenza sfasata
+    if tracker.trains:
+        all_cached = all(
+            tracker.train_data(tn) is not None for tn in tracker.trains
         )
+        resources.hub.async_schedule(
+            TRACKER_JOB, startup_delay() if all_cached else 0
+        )
+
+
+@callback
+def _async_add_train_sensor(
+    tracker: TrainTracker, async_add_entities: AddEntitiesCallback, train_number: str
+) -> None:
+    """Un solo sensore per numero treno, chiunque lo segua."""
+    if train_number in tracker.entities:
+        return
+    tracker.entities.add(train_number)
+    async_add_entities([MyTrenoStaticTrainSensor(tracker, train_number)])
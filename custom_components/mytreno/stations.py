@@ -0,0 +1,88 @@
+"""Indice stazioni: ricerca per prefisso / fuzzy e mappa inversa id → nome."""
+from __future__ import annotations
+
+import difflib
+import re
+import unicodedata
+from bisect import bisect_left
+
+_SEPARATORS = re.compile(r"[\s'’`.\-/()]+")
+
+
+def normalize(text: str) -> str:
+    """“Forlì-Cesena ” → “forli cesena” (senza accenti, minuscolo)."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _SEPARATORS.sub(" ", stripped.casefold()).strip()
+
+
+class StationIndex:
+    """
+    Costruito una volta (fuori dall'event loop) da {nome: station_id}.
+
+    - prefisso sul nome completo e su ogni parola (“termini” → Roma Termini)
+    - fuzzy con difflib come ripiego per gli errori di battitura
+    """
+
+    def __init__(self, stations: dict[str, str]) -> None:
+        self.stations = stations
+        self._by_id   = {sid: name for name, sid in stations.items()}
+        self._by_norm = {normalize(name): name for name in stations}
+        self._keys    = sorted(self._by_norm)
+        # (parola normalizzata, nome) per il prefisso sulle parole interne
+        self._words = sorted(
+            (word, name)
+            for norm, name in self._by_norm.items()
+            for word in norm.split(" ")[1:]
+        )
+        self._word_keys = [w for w, _ in self._words]
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def name(self, station_id: str) -> str | None:
+        return self._by_id.get(station_id)
+
+    def station_id(self, name: str) -> str | None:
+        """Nome (anche senza accenti/maiuscole) → id, solo match esatto."""
+        exact = self.stations.get(name)
+        if exact:
+            return exact
+        canonical = self._by_norm.get(normalize(name))
+        return self.stations[canonical] if canonical else None
+
+    def resolve(self, value: str) -> str | None:
+        """Accetta sia un id (“S08409”) sia un nome; ritorna l'id."""
+        return value if value in self._by_id else self.station_id(value)
+
+    def search(self, query: str, limit: int = 10) -> list[str]:
+        """Nomi che iniziano con `query`, poi parole interne; fuzzy se nessuno."""
+        if query in self._by_id:
+            return [self._by_id[query]]
+        q = normalize(query)
+        if not q:
+            return []
+
+        found: list[str] = []
+        for keys, values in (
+            (self._keys, None),
+            (self._word_keys, self._words),
+        ):
+            i = bisect_left(keys, q)
+            while i < len(keys) and keys[i].startswith(q) and len(found) < limit:
+                name = self._by_norm[keys[i]] if values is None else values[i][1]
+                if name not in found:
+                    found.append(name)
+                i += 1
+
+        if not found:
+            # fuzzy solo fra i nomi con la stessa iniziale: molto più rapido
+            lo = bisect_left(self._keys, q[0])
+            hi = bisect_left(self._keys, chr(ord(q[0]) + 1))
+            found = [
+                self._by_norm[key]
+                for key in difflib.get_close_matches(
+                    q, self._keys[lo:hi], n=limit, cutoff=0.75
+                )
+            ]
+        return found
@@ -0,0 +1,129 @@
+"""Ultimi dati buoni salvati su disco per l'avvio “a caldo”."""
+from __future__ import annotations
+
+from datetime import date
+import logging
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .client import get_client
+from .const import DATA_CLIENT, DATA_STORE, DATA_TRACKER, DOMAIN
+from .models import STALE_KEY, Board, TrainSnapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY     = f"{DOMAIN}.cache"
+SAVE_DELAY      = 60   # secondi: accorpa i salvataggi di più aggiornamenti
+
+
+class MyTrenoStore:
+    """
+    Contenuto di .storage/mytreno.cache (in memoria come modelli, su disco
+    come dict):
+      - boards:      {station_id: tabellone}
+      - trains:      {numero_treno: snapshot}
+      - tracked:     {numero_treno: origine} aggiunti con add_train
+      - selected:    treno selezionato con set_train
+      - resolutions: {numero_treno: [giorno ISO, candidati]}
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self.boards:   dict[str, Board] = {}
+        self.trains:   dict[str, TrainSnapshot] = {}
+        self.tracked:  dict[str, str | None] = {}
+        self.selected: str | None = None
+        self.resolutions: dict[str, list] = {}
+
+    async def async_load(self) -> None:
+        stored = await self._store.async_load() or {}
+        try:
+            self.boards = {
+                sid: Board.from_dict(raw, stale=True)
+                for sid, raw in stored.get("boards", {}).items()
+            }
+            self.trains = {
+                tn: TrainSnapshot.from_dict(raw, stale=True)
+                for tn, raw in stored.get("trains", {}).items()
+            }
+        except (AttributeError, TypeError) as err:
+            _LOGGER.warning("Cache MyTreno illeggibile, avvio a freddo: %s", err)
+            self.boards, self.trains = {}, {}
+        self.tracked  = stored.get("tracked", {})
+        self.selected = stored.get("selected")
+
+        self.resolutions = stored.get("resolutions", {})
+        client = get_client(self.hass)
+        for tn, (day, candidates) in self.resolutions.items():
+            try:
+                client.resolutions.setdefault(tn, (date.fromisoformat(day), candidates))
+            except (TypeError, ValueError):
+                continue
+
+    def board(self, station_id: str) -> Board | None:
+        """Tabellone salvato, marcato come non aggiornato."""
+        cached = self.boards.get(station_id)
+        return cached.as_stale() if cached else None
+
+    @callback
+    def async_set_board(self, station_id: str, data: Board) -> None:
+        self.boards[station_id] = data
+        self.async_schedule_save()
+
+    @callback
+    def async_schedule_save(self) -> None:
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    async def async_flush(self) -> None:
+        """Salva subito, senza attendere il salvataggio ritardato."""
+        await self._store.async_save(self._data_to_save())
+
+    @callback
+    def _data_to_save(self) -> dict:
+        tracker = self.hass.data[DOMAIN].get(DATA_TRACKER)
+        if tracker is not None:
+            live = tracker.coordinator.data or {}
+            trains = {}
+            for tn in tracker.trains:
+                snap = live.get(tn)
+                if snap and not snap.stale:
+                    trains[tn] = snap
+                elif tn in self.trains:
+                    trains[tn] = self.trains[tn]
+            self.trains = trains
+            self.tracked  = tracker.service_trains()
+            self.selected = tracker.selected
+
+        # niente get_client(): a sessione chiusa non se ne apre un'altra
+        client = self.hass.data[DOMAIN].get(DATA_CLIENT)
+        if client is not None:
+            self.resolutions = {
+                tn: [day.isoformat(), candidates]
+                for tn, (day, candidates) in client.resolutions.items()
+            }
+        return {
+            "boards":      {sid: _saved(b.as_dict()) for sid, b in self.boards.items()},
+            "trains":      {tn: _saved(t.as_dict()) for tn, t in self.trains.items()},
+            "tracked":     self.tracked,
+            "selected":    self.selected,
+            "resolutions": self.resolutions,
+        }
+
+
+def _saved(data: dict) -> dict:
+    """Il flag stale non va su disco: lo rimette async_load."""
+    return {k: v for k, v in data.items() if k != STALE_KEY}
+
+
+async def async_get_store(hass: HomeAssistant) -> MyTrenoStore:
+    """Store condiviso, letto da disco una sola volta."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    store = domain_data.get(DATA_STORE)
+    if store is None:
+        store = MyTrenoStore(hass)
+        await store.async_load()
+        domain_data[DATA_STORE] = store
+    return store
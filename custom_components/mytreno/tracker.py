@@ -0,0 +1,202 @@
+"""Tracker multi-treno: un solo coordinator per tutti i treni seguiti."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from datetime import timedelta
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .client import get_client
+from .events import diff_train, fire_events
+from .history import DelayHistory
+from .scheduler import train_interval
+from .models import TrainSnapshot
+from .storage import MyTrenoStore
+from .utils import fetch_train_data
+
+_LOGGER = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = 4                     # treni scaricati in parallelo
+RETRY_INTERVAL  = timedelta(minutes=1)  # dopo un errore sul singolo treno
+MIN_INTERVAL    = timedelta(seconds=10)
+
+OWNER_SERVICE  = "service"    # treni aggiunti con mytreno.add_train
+OWNER_SELECTED = "selected"   # treno scelto con mytreno.set_train
+
+
+class TrainTracker:
+    """
+    Insieme di treni seguiti, aggiornati in un'unica chiamata batch.
+
+    Ogni treno ha uno o più “proprietari” (config entry, servizio, treno
+    selezionato) e resta nel tracker finché almeno uno lo richiede.
+    Il coordinator scarica solo i treni “scaduti” secondo train_interval()
+    e calcola `next_interval`, la prossima scadenza, che l'hub usa per
+    riprogrammarlo; coordinator.data è {numero_treno: dati}.
+    """
+
+    def __init__(
+        self, hass: HomeAssistant, store: MyTrenoStore, history: DelayHistory
+    ) -> None:
+        self.hass = hass
+        self._store = store
+        self.history = history
+        self.selected: str | None = None
+        self._owners:   dict[str, set[str]] = {}
+        self._origins:  dict[str, str | None] = {}
+        self._next_due: dict[str, float] = {}
+        self.entities:  set[str] = set()   # treni che hanno già un sensore
+        self.next_interval: timedelta | None = None
+        self.coordinator = DataUpdateCoordinator(
+            hass,
+            logger=_LOGGER,
+            name="mytreno_train_tracker",
+            update_method=self._async_update,
+            update_interval=None,
+        )
+
+    @property
+    def trains(self) -> list[str]:
+        return list(self._owners)
+
+    def train_data(self, train_number: str | None) -> TrainSnapshot | None:
+        """Ultimo snapshot del treno (None se assente)."""
+        if not train_number or not self.coordinator.data:
+            return None
+        return self.coordinator.data.get(train_number)
+
+    def sensor_trains(self) -> list[str]:
+        """Treni che devono avere un sensore proprio (tutti tranne il solo selezionato)."""
+        return [
+            tn for tn, owners in self._owners.items()
+            if owners - {OWNER_SELECTED}
+        ]
+
+    def service_trains(self) -> dict[str, str | None]:
+        """Treni aggiunti con add_train → origine (per il salvataggio)."""
+        return {
+            tn: self._origins.get(tn)
+            for tn, owners in self._owners.items()
+            if OWNER_SERVICE in owners
+        }
+
+    @callback
+    def async_restore(self) -> None:
+        """Avvio a caldo: snapshot salvati (marcati stale) e treni seguiti."""
+        self.coordinator.data = {
+            tn: snap.as_stale() for tn, snap in self._store.trains.items()
+        }
+        for tn, origin in self._store.tracked.items():
+            self.async_add(tn, origin)
+        if self._store.selected:
+            self.async_select(self._store.selected)
+
+    # ─────────────────────────────────────────────────────────────────────
+    @callback
+    def async_add(
+        self, train_number: str, origin: str | None = None,
+        owner: str = OWNER_SERVICE,
+    ) -> bool:
+        """Aggiunge un treno; True se prima non era seguito."""
+        is_new = train_number not in self._owners
+        self._owners.setdefault(train_number, set()).add(owner)
+        if origin or is_new:
+            self._origins[train_number] = origin
+        if is_new:
+            self._next_due[train_number] = 0
+            self._store.async_schedule_save()
+        return is_new
+
+    @callback
+    def async_remove(self, train_number: str, owner: str = OWNER_SERVICE) -> bool:
+        """Toglie un proprietario; True se il treno non è più seguito."""
+        owners = self._owners.get(train_number)
+        if owners is None:
+            return False
+        owners.discard(owner)
+        if owners:
+            return False
+        del self._owners[train_number]
+        self._origins.pop(train_number, None)
+        self._next_due.pop(train_number, None)
+        if self.coordinator.data:
+            self.coordinator.data.pop(train_number, None)
+        self._store.async_schedule_save()
+        return True
+
+    @callback
+    def async_select(self, train_number: str) -> None:
+        """Sposta il “treno selezionato” globale e lo rende subito scaduto."""
+        if self.selected and self.selected != train_number:
+            self.async_remove(self.selected, OWNER_SELECTED)
+        self.selected = train_number
+        self.async_add(train_number, owner=OWNER_SELECTED)
+        self._next_due[train_number] = 0
+        self._store.async_schedule_save()
+
+    @callback
+    def async_apply_snapshot(self, train_number: str, snapshot: TrainSnapshot) -> None:
+        """Mostra subito uno snapshot già pronto (es. dal prefetch)."""
+        data = dict(self.coordinator.data or {})
+        data[train_number] = snapshot
+        self.coordinator.async_set_updated_data(data)
+
+    # ─────────────────────────────────────────────────────────────────────
+    async def _async_update(self) -> dict[str, TrainSnapshot]:
+        now  = time.monotonic()
+        data = {
+            tn: snap for tn, snap in (self.coordinator.data or {}).items()
+            if tn in self._owners
+        }
+        due = [tn for tn in self._owners if self._next_due.get(tn, 0) <= now]
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+        metrics = get_client(self.hass).metrics
+
+        async def _fetch(tn: str) -> TrainSnapshot | None:
+            async with semaphore:
+                with metrics.time_update(f"train_{tn}"):
+                    return await fetch_train_data(
+                        self.hass, tn, self._origins.get(tn)
+                    )
+
+        with metrics.time_update("tracker"):
+            results = await asyncio.gather(
+                *(_fetch(tn) for tn in due), return_exceptions=True
+            )
+
+        for tn, result in zip(due, results):
+            if tn not in self._owners:        # rimosso durante il fetch
+                continue
+            if isinstance(result, BaseException):
+                _LOGGER.warning("Treno %s: aggiornamento fallito (%s)", tn, result)
+                self._next_due[tn] = now + RETRY_INTERVAL.total_seconds()
+                if tn in data and not data[tn].stale:
+                    # si tiene l'ultimo dato, ma dichiarandolo vecchio
+                    data[tn] = data[tn].as_stale()
+                continue
+            fire_events(self.hass, diff_train(tn, data.get(tn), result))
+            self.history.async_observe(tn, result)
+            data[tn] = result
+            interval = train_interval(result)
+            self._next_due[tn] = (
+                now + interval.total_seconds() if interval else math.inf
+            )
+
+        self._reschedule(now)
+        if due:
+            self._store.async_schedule_save()
+        return data
+
+    def _reschedule(self, now: float) -> None:
+        """next_interval = tempo alla prossima scadenza (None se nessuna)."""
+        next_due = min(self._next_due.values(), default=math.inf)
+        if next_due == math.inf:
+            self.next_interval = None
+        else:
+            self.next_interval = max(MIN_INTERVAL, timedelta(seconds=next_due - now))
@@ -1,18 +1,43 @@
-import aiohttp
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, replace
+from functools import lru_cache
+import logging
+import sys
 from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo                      # Python 3.9+
 
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.helpers.update_coordinator import UpdateFailed
 
-from .const import URL_BASE
+from .client import get_client
+from .const import (
+    CONF_BOARD_CATEGORIES,
+    CONF_BOARD_DESTINATIONS,
+    CONF_BOARD_ROWS,
+    CONF_BOARD_WINDOW,
+    DEFAULT_BOARD_ROWS,
+)
+from .governor import NoTokenError
+from .models import Board, BoardRow, Commute, CommuteRow, Stop, TrainSnapshot
+from .stations import normalize
+
+_LOGGER = logging.getLogger(__name__)
+
+FETCH_DEADLINE = 15  # secondi, scadenza complessiva delle chiamate parallele
+
+COMMUTE_SCAN_ROWS = 30     # partenze esaminate per trovare i treni verso B
+COMMUTE_LOOKUPS   = 8      # itinerari non in cache scaricati per aggiornamento
+ITINERARY_MAX     = 1000   # itinerari tenuti in memoria (un giorno di servizio)
+SEEDED_MAX        = 500    # origini lette dai tabelloni tenute in memoria
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  Fuso / conversioni tempo
 # ─────────────────────────────────────────────────────────────────────────────
 _TZ = ZoneInfo("Europe/Rome")          # cambia da solo CET↔CEST
 
+@lru_cache(maxsize=4096)      # gli stessi orari tornano a ogni poll
 def ms_to_local_iso(ms: int | None) -> str | None:
     """Epoch-ms → stringa ISO in fuso orario di Roma."""
     return (
@@ -35,129 +60,369 @@ def build_timestamp() -> str:
         "%a %b %d %Y %H:%M:%S GMT+0200 (Ora legale dell’Europa centrale)"
     )
 
+_ROMAN_NUMERALS = {
+    "I": 1, "II": 2, "III": 3, "IV": 4, "V": 5, "VI": 6, "VII": 7,
+    "VIII": 8, "IX": 9, "X": 10, "XI": 11, "XII": 12, "XIII": 13,
+    "XIV": 14, "XV": 15, "XVI": 16, "XVII": 17, "XVIII": 18, "XIX": 19,
+    "XX": 20,
+}
+
 def roman_to_int(roman: str):
     """Converte numeri romani I-XX in arabi; se non trova ritorna l’originale."""
-    roman_numerals = {
-        "I": 1, "II": 2, "III": 3, "IV": 4, "V": 5, "VI": 6, "VII": 7,
-        "VIII": 8, "IX": 9, "X": 10, "XI": 11, "XII": 12, "XIII": 13,
-        "XIV": 14, "XV": 15, "XVI": 16, "XVII": 17, "XVIII": 18, "XIX": 19,
-        "XX": 20,
-    }
-    return roman_numerals.get(roman, roman)
+    try:
+        return _ROMAN_NUMERALS.get(roman, roman)
+    except TypeError:          # non hashable: lo si lascia com'è
+        return roman
+
+
+def _intern(value):
+    """Nomi di stazione/binario condivisi fra snapshot invece che duplicati."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+async def _gather_partial(*aws, deadline: float = FETCH_DEADLINE) -> list:
+    """
+    Esegue le chiamate in parallelo con un'unica scadenza complessiva.
+    Ritorna i risultati nell'ordine dato; chi fallisce o sfora la scadenza
+    diventa un'eccezione nella lista invece di far fallire tutto.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:                      # asyncio.wait non accetta insiemi vuoti
+        return []
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    results = []
+    for task in tasks:
+        if task in pending:
+            results.append(asyncio.TimeoutError(f"scadenza {deadline}s superata"))
+        elif task.exception() is not None:
+            results.append(task.exception())
+        else:
+            results.append(task.result())
+    return results
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Tabellone: configurazione per entry + mappa campi precalcolata per tipo
+# ─────────────────────────────────────────────────────────────────────────────
+@dataclass(frozen=True)
+class BoardConfig:
+    """Quante righe, quale finestra oraria e quali treni mostrare."""
+
+    rows: int = DEFAULT_BOARD_ROWS
+    window_minutes: int = 0                      # 0 = nessun limite
+    destinations: tuple[str, ...] = ()           # sottostringhe, minuscole
+    categories: frozenset[str] = frozenset()     # vuoto = tutte
+
+    @classmethod
+    def from_options(cls, options: dict) -> BoardConfig:
+        return cls(
+            rows=int(options.get(CONF_BOARD_ROWS, DEFAULT_BOARD_ROWS)),
+            window_minutes=int(options.get(CONF_BOARD_WINDOW, 0)),
+            destinations=tuple(
+                d.strip().lower()
+                for d in options.get(CONF_BOARD_DESTINATIONS, "").split(",")
+                if d.strip()
+            ),
+            categories=frozenset(options.get(CONF_BOARD_CATEGORIES, ())),
+        )
+
+
+def _soppresso(provvedimento) -> bool:
+    """provvedimento ViaggiaTreno: 1 = treno soppresso."""
+    return provvedimento == 1
+
+
+# (campo di BoardRow, chiave ViaggiaTreno, default, conversione)
+BOARD_FIELDS = {
+    "partenze": (
+        ("treno",             "compNumeroTreno",                       "??",  None),
+        ("orario",            "compOrarioPartenza",                    "??",  None),
+        ("localita",          "destinazione",                          "??",  _intern),
+        ("ritardo",           "ritardo",                               "?",   None),
+        ("binario_previsto",  "binarioProgrammatoPartenzaDescrizione", "N/A", roman_to_int),
+        ("binario_effettivo", "binarioEffettivoPartenzaDescrizione",   "N/A", roman_to_int),
+        ("soppresso",         "provvedimento",                         0,     _soppresso),
+        ("numero",            "numeroTreno",                           None,  None),
+        ("cod_origine",       "codOrigine",                            None,  None),
+        ("data_partenza",     "dataPartenzaTreno",                     None,  None),
+    ),
+    "arrivi": (
+        ("treno",             "compNumeroTreno",                       "??",  None),
+        ("orario",            "compOrarioArrivo",                      "??",  None),
+        ("localita",          "origine",                               "??",  _intern),
+        ("ritardo",           "ritardo",                               "?",   None),
+        ("binario_previsto",  "binarioProgrammatoArrivoDescrizione",   "N/A", roman_to_int),
+        ("binario_effettivo", "binarioEffettivoArrivoDescrizione",     "N/A", roman_to_int),
+        ("soppresso",         "provvedimento",                         0,     _soppresso),
+        ("numero",            "numeroTreno",                           None,  None),
+        ("cod_origine",       "codOrigine",                            None,  None),
+        ("data_partenza",     "dataPartenzaTreno",                     None,  None),
+    ),
+}
+# orario in epoch-ms (per la finestra) e località (per il filtro) per tipo
+BOARD_TIME_KEY  = {"partenze": "orarioPartenza", "arrivi": "orarioArrivo"}
+BOARD_PLACE_KEY = {"partenze": "destinazione",   "arrivi": "origine"}
+
 
+def _category(treno: dict) -> str:
+    cat = treno.get("categoriaDescrizione") or treno.get("categoria")
+    if not cat:
+        cat = (treno.get("compNumeroTreno") or "").split(" ")[0]
+    return cat.strip().upper()
 
-async def fetch_data(hass: HomeAssistant, station_id: str):
-    """Ultime 10 partenze e arrivi di una stazione."""
+
+def _parse_board(
+    kind: str, trains_raw: list, config: BoardConfig = BoardConfig()
+) -> list[BoardRow]:
+    """Righe del tabellone da partenze/arrivi grezzi, filtrate secondo config."""
+    fields    = BOARD_FIELDS[kind]
+    time_key  = BOARD_TIME_KEY[kind]
+    place_key = BOARD_PLACE_KEY[kind]
+    limit_ms  = (
+        (datetime.now(timezone.utc).timestamp() + config.window_minutes * 60) * 1000
+        if config.window_minutes else None
+    )
+
+    rows = []
+    for treno in trains_raw:
+        if len(rows) >= config.rows:
+            break
+        if limit_ms is not None:
+            orario = treno.get(time_key)
+            if orario and orario > limit_ms:
+                break                           # tabellone ordinato per orario
+        if config.categories and _category(treno) not in config.categories:
+            continue
+        if config.destinations:
+            place = (treno.get(place_key) or "").lower()
+            if not any(d in place for d in config.destinations):
+                continue
+
+        row = {}
+        for out_key, vt_key, default, convert in fields:
+            value = treno.get(vt_key, default)
+            row[out_key] = convert(value) if convert else value
+        rows.append(BoardRow(**row))
+    return rows
+
+
+async def fetch_data(
+    hass: HomeAssistant,
+    station_id: str,
+    config: BoardConfig = BoardConfig(),
+    kinds: tuple[str, ...] = ("partenze", "arrivi"),
+) -> Board:
+    """
+    Prossime partenze e arrivi di una stazione (righe, finestra e filtri
+    secondo `config`), scaricati in parallelo.
+    Se uno dei due tabelloni fallisce si ritorna comunque l'altro;
+    UpdateFailed solo se falliscono entrambi.
+    """
     timestamp = build_timestamp()
-    urls = {
-        "partenze": f"{URL_BASE}/partenze/{station_id}/{timestamp}",
-        "arrivi":   f"{URL_BASE}/arrivi/{station_id}/{timestamp}",
-    }
-    data    = {"partenze": [], "arrivi": []}
-    session = async_get_clientsession(hass)
-
-    for kind, url in urls.items():
+    data   = {kind: [] for kind in kinds}
+    client = get_client(hass)
+
+    results = await _gather_partial(
+        *(
+            client.async_get(kind, station_id, timestamp, key=(station_id,))
+            for kind in data
+        )
+    )
+
+    errors = {}
+    for kind, result in zip(list(data), results):
+        if isinstance(result, BaseException):
+            errors[kind] = result
+            continue
+        status, trains_raw = result
+        if status == 204:               # nessun treno: tabellone vuoto, non un errore
+            continue
+        if status != 200:
+            errors[kind] = UpdateFailed(f"HTTP {status}")
+            continue
+        if not isinstance(trains_raw, list):
+            continue
         try:
-            async with session.get(url, timeout=10) as res:
-                if res.status != 200:
-                    continue
-                trains_raw = await res.json()
-                if not isinstance(trains_raw, list):
-                    continue
-
-                # chiavi diverse per arrivi/partenze
-                bin_prog_key = (
-                    "binarioProgrammatoPartenzaDescrizione"
-                    if kind == "partenze"
-                    else "binarioProgrammatoArrivoDescrizione"
-                )
-                bin_eff_key = (
-                    "binarioEffettivoPartenzaDescrizione"
-                    if kind == "partenze"
-                    else "binarioEffettivoArrivoDescrizione"
-                )
-
-                for treno in trains_raw[:10]:
-                    data[kind].append(
-                        {
-                            "treno": treno.get("compNumeroTreno", "??"),
-                            "orario": treno.get(
-                                "compOrarioPartenza"
-                                if kind == "partenze"
-                                else "compOrarioArrivo",
-                                "??",
-                            ),
-                            (
-                                "destinazione"
-                                if kind == "partenze"
-                                else "provenienza"
-                            ): treno.get(
-                                "destinazione" if kind == "partenze" else "origine", "??"
-                            ),
-                            "ritardo": treno.get("ritardo", "?"),
-                            "binario_previsto": roman_to_int(
-                                treno.get(bin_prog_key, "N/A")
-                            ),
-                            "binario_effettivo": roman_to_int(
-                                treno.get(bin_eff_key, "N/A")
-                            ),
-                        }
-                    )
+            data[kind] = _parse_board(kind, trains_raw, config)
         except Exception as err:
-            raise UpdateFailed(f"Errore fetch {kind}: {err}") from err
+            errors[kind] = err
+
+    if len(errors) == len(data):
+        raise UpdateFailed(
+            "Errore fetch "
+            + ", ".join(f"{kind}: {err!r}" for kind, err in errors.items())
+        )
+    for kind, err in errors.items():
+        _LOGGER.warning(
+            "Stazione %s: %s non disponibile (%r), tabellone parziale",
+            station_id, kind, err,
+        )
+
+    return Board(partenze=data.get("partenze", []), arrivi=data.get("arrivi", []))
+
 
-    return data
 # ─────────────────────────────────────────────────────────────────────────────
 #  Tracking live del singolo treno selezionato
 # ─────────────────────────────────────────────────────────────────────────────
-async def _resolve_train(train_number: str, session: aiohttp.ClientSession):
+def _service_day():
+    """Giorno di servizio corrente (data di Roma)."""
+    return datetime.now(_TZ).date()
+
+
+def _parse_autocomplete(txt: str) -> list[dict]:
+    """
+    Righe “9612 - NAPOLI CENTRALE - 18/10/26|9612-S09218-1760738400000”
+    → [{label, station_id, ts}, …] nell'ordine restituito da ViaggiaTreno.
+    """
+    candidates = []
+    for line in txt.splitlines():
+        label, _, code = line.strip().partition("|")
+        parts = code.strip().split("-")
+        if len(parts) == 3 and parts[1] and parts[2]:
+            candidates.append(
+                {"label": label.strip(), "station_id": parts[1], "ts": parts[2]}
+            )
+    return candidates
+
+
+async def async_train_candidates(
+    hass: HomeAssistant, train_number: str, optional: bool = False
+) -> list[dict]:
+    """
+    Origini possibili di un numero treno, in cache per il giorno di servizio.
+    Usato sia dal polling sia dal config flow.
+    """
+    client = get_client(hass)
+    today  = _service_day()
+
+    cached = client.resolutions.get(train_number)
+    if cached and cached[0] == today:
+        return cached[1]
+
+    status, txt = await client.async_get(
+        "cercaNumeroTrenoTrenoAutocomplete", train_number,
+        as_text=True, optional=optional,
+    )
+    txt = (txt or "").strip()
+    if status != 200 or not txt:
+        raise UpdateFailed(f"Treno {train_number} non trovato (HTTP {status})")
+
+    candidates = _parse_autocomplete(txt)
+    if not candidates:
+        raise UpdateFailed(f"Parsing autocomplete: nessun candidato (raw='{txt}')")
+    client.resolutions[train_number] = (today, candidates)
+    return candidates
+
+
+def seed_train_resolution(
+    hass: HomeAssistant, train_number: str, station_id: str, ts, label: str = ""
+) -> None:
+    """
+    Origine nota già dal tabellone (codOrigine + dataPartenzaTreno): evita
+    la chiamata autocomplete per quel treno. Tenuta a parte da
+    `resolutions`, che resta l'elenco completo delle origini (config flow).
+    """
+    seeded = get_client(hass).seeded
+    if len(seeded) >= SEEDED_MAX and train_number not in seeded:
+        del seeded[next(iter(seeded))]          # il più vecchio inserito
+    seeded[train_number] = (
+        _service_day(),
+        {"label": label or f"{train_number}", "station_id": station_id, "ts": str(ts)},
+    )
+
+
+def forget_train(hass: HomeAssistant, train_number: str) -> None:
+    """Scarta la risoluzione in cache (treno soppresso / non più valido)."""
+    client = get_client(hass)
+    client.resolutions.pop(train_number, None)
+    client.seeded.pop(train_number, None)
+    client.invalidate("cercaNumeroTrenoTrenoAutocomplete", train_number)
+
+
+async def _resolve_train(
+    hass: HomeAssistant,
+    train_number: str,
+    origin: str | None = None,
+    optional: bool = False,
+):
     """/cercaNumeroTrenoTrenoAutocomplete → station_id + timestamp."""
-    url = f"{URL_BASE}/cercaNumeroTrenoTrenoAutocomplete/{train_number}"
-    async with session.get(url, timeout=10) as res:
-        txt = (await res.text()).strip()
-        if res.status != 200 or not txt:
-            raise UpdateFailed(f"Treno {train_number} non trovato (HTTP {res.status})")
-    try:
-        candidates = txt.split("|")[1:]
-        for cand in reversed(candidates):  # prova dal più recente
-            parts = cand.strip().split(" ")[0].split("-")
-            if len(parts) == 3:
-                _, station_id, ts = parts
-                return station_id, ts
-        raise ValueError(f"Nessun candidato valido trovato: {txt}")
-    except Exception as err:
-        raise UpdateFailed(f"Parsing autocomplete: {err} (raw='{txt}')") from err
-    return station_id, ts
-async def fetch_train_data(hass: HomeAssistant, train_number: str):
+    seeded = get_client(hass).seeded.get(train_number)
+    if seeded and seeded[0] == _service_day():
+        cand = seeded[1]
+        if origin is None or cand["station_id"] == origin:
+            return cand["station_id"], cand["ts"]
+    candidates = await async_train_candidates(hass, train_number, optional)
+    if origin:
+        for cand in candidates:
+            if cand["station_id"] == origin:
+                return cand["station_id"], cand["ts"]
+        # origine esplicita non circolante oggi: mai un treno diverso al suo posto
+        raise UpdateFailed(
+            f"Treno {train_number} con origine {origin} non presente oggi"
+        )
+    cand = candidates[-1]  # nessuna origine indicata: il più recente
+    return cand["station_id"], cand["ts"]
+
+
+async def fetch_train_data(
+    hass: HomeAssistant,
+    train_number: str,
+    origin: str | None = None,
+    optional: bool = False,
+) -> TrainSnapshot | None:
     """
-    Ritorna dict:
+    Ritorna TrainSnapshot:
       - ritardo, stato, ultima_stazione, ora_ultimo_rilevamento
       - prossima_stazione, orario_previsto_prossima
-      - fermate[]   (lista di dict)
+      - fermate   (tupla di Stop)
+
+    Con `optional` (prefetch) solo richieste che trovano subito un token:
+    se ne manca uno si propaga NoTokenError, mai uno snapshot a metà.
     """
     if not train_number:
-        return {}
+        return None
 
-    session = async_get_clientsession(hass)
+    client = get_client(hass)
 
     # ── 1.  resolve per avere station_id + timestamp
-    station_id, ts = await _resolve_train(train_number, session)
-
-    # ── 2.  andamentoTreno (overview)
-    url_andamento = f"{URL_BASE}/andamentoTreno/{station_id}/{train_number}/{ts}"
-    # ── 3.  tratteCanvas   (tutte le fermate)
-    url_tratte    = f"{URL_BASE}/tratteCanvas/{station_id}/{train_number}/{ts}"
-
-    async with session.get(url_andamento, timeout=10) as res_a, \
-               session.get(url_tratte,    timeout=10) as res_t:
-        if res_a.status != 200:
-            raise UpdateFailed(f"Errore HTTP {res_a.status} su andamentoTreno")
-        andamento = await res_a.json()
-        if res_t.status != 200:
-            raise UpdateFailed(f"Errore HTTP {res_t.status} su tratteCanvas")
-        tratte_raw = await res_t.json()
-        if not isinstance(tratte_raw, list):
-            tratte_raw = []
+    station_id, ts = await _resolve_train(hass, train_number, origin, optional)
+
+    # ── 2.  andamentoTreno (overview) + 3. tratteCanvas (tutte le fermate)
+    #        in parallelo; senza tratteCanvas si ritorna l'overview senza fermate
+    res_a, res_t = await _gather_partial(
+        client.async_get(
+            "andamentoTreno", station_id, train_number, ts, optional=optional
+        ),
+        client.async_get(
+            "tratteCanvas", station_id, train_number, ts, optional=optional
+        ),
+    )
+    for res in (res_a, res_t):
+        if isinstance(res, NoTokenError):
+            raise res
+    if isinstance(res_a, BaseException):
+        raise UpdateFailed(f"Errore andamentoTreno: {res_a!r}") from res_a
+    status_a, andamento = res_a
+    if status_a in (204, 404):
+        forget_train(hass, train_number)
+    if status_a != 200:
+        raise UpdateFailed(f"Errore HTTP {status_a} su andamentoTreno")
+
+    tratte_raw = []
+    if isinstance(res_t, BaseException):
+        _LOGGER.warning(
+            "Treno %s: tratteCanvas non disponibile (%r)", train_number, res_t
+        )
+    elif res_t[0] != 200:
+        _LOGGER.warning(
+            "Treno %s: errore HTTP %s su tratteCanvas", train_number, res_t[0]
+        )
+    elif isinstance(res_t[1], list):
+        tratte_raw = res_t[1]
+        _remember_itinerary(client, station_id, train_number, ts, tratte_raw)
 
     # ── riepilogo
     fermate = []
@@ -180,14 +445,14 @@ async def fetch_train_data(hass: HomeAssistant, train_number: str):
         binario = roman_to_int(bin_eff or bin_prog)
 
         fermate.append(
-            {
-                "stazione": f.get("stazione", "--"),
-                "programmata": orario_prev,
-                "effettiva":   orario_eff,
-                "ritardo": f.get("ritardo", 0),
-                "arrivato": arrivato,
-                "binario": binario,
-            }
+            Stop(
+                stazione=_intern(f.get("stazione", "--")),
+                programmata=orario_prev,
+                effettiva=orario_eff,
+                ritardo=f.get("ritardo", 0),
+                arrivato=arrivato,
+                binario=_intern(binario),
+            )
         )
         if not arrivato and not prossima_stazione:
             prossima_stazione        = f.get("stazione")
@@ -197,13 +462,162 @@ async def fetch_train_data(hass: HomeAssistant, train_number: str):
     stato_raw = andamento.get("compRitardoAndamento", [])
     stato     = stato_raw[0] if isinstance(stato_raw, list) else stato_raw
 
-    return {
-        "train_number":             train_number,
-        "ritardo":                  andamento.get("ritardo", 0),
-        "stato":                    stato,
-        "ultima_stazione":          andamento.get("stazioneUltimoRilevamento", "--"),
-        "ora_ultimo_rilevamento":   ms_to_local_iso(andamento.get("oraUltimoRilevamento")),
-        "prossima_stazione":        prossima_stazione,
-        "orario_previsto_prossima": orario_previsto_prossima,
-        "fermate":                  fermate,
-    }
+    return TrainSnapshot(
+        train_number=train_number,
+        ritardo=andamento.get("ritardo", 0),
+        stato=stato,
+        ultima_stazione=_intern(andamento.get("stazioneUltimoRilevamento", "--")),
+        ora_ultimo_rilevamento=ms_to_local_iso(andamento.get("oraUltimoRilevamento")),
+        prossima_stazione=prossima_stazione,
+        orario_previsto_prossima=orario_previsto_prossima,
+        soppresso=(
+            _soppresso(andamento.get("provvedimento"))
+            or andamento.get("tipoTreno") == "ST"
+        ),
+        fermate=tuple(fermate),
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Tratta A → B: partenze da A filtrate sugli itinerari (cache giornaliera)
+# ─────────────────────────────────────────────────────────────────────────────
+def _remember_itinerary(client, origin: str, train_number: str, ts, tratte_raw: list):
+    """Fermate (id, nome normalizzato, programmata) valide per tutto il giorno."""
+    cache = client.itineraries
+    if len(cache) >= ITINERARY_MAX:
+        del cache[next(iter(cache))]            # il più vecchio inserito
+    cache[(origin, train_number, str(ts))] = (
+        _service_day(),
+        tuple(
+            (
+                f.get("id"),
+                sys.intern(normalize(f.get("stazione") or "")),
+                f.get("programmata"),
+            )
+            for f in (item.get("fermata", {}) for item in tratte_raw)
+        ),
+    )
+
+
+def _cached_itinerary(client, origin: str, train_number: str, ts) -> tuple | None:
+    key    = (origin, train_number, str(ts))
+    cached = client.itineraries.get(key)
+    if cached is None:
+        return None
+    if cached[0] != _service_day():
+        del client.itineraries[key]
+        return None
+    return cached[1]
+
+
+async def _async_itinerary(
+    hass: HomeAssistant, origin: str, train_number: str, ts
+) -> tuple | None:
+    """Itinerario di un treno: dalla cache del giorno o da tratteCanvas."""
+    client = get_client(hass)
+    itinerary = _cached_itinerary(client, origin, train_number, ts)
+    if itinerary is not None:
+        return itinerary
+    status, tratte_raw = await client.async_get(
+        "tratteCanvas", origin, train_number, str(ts)
+    )
+    if status in (204, 404):
+        # nessun itinerario oggi: ricordato vuoto, così non lo si richiede più
+        tratte_raw = []
+    elif status != 200 or not isinstance(tratte_raw, list):
+        return None
+    _remember_itinerary(client, origin, train_number, ts, tratte_raw)
+    return _cached_itinerary(client, origin, train_number, ts)
+
+
+def _stop_index(itinerary: tuple, station_id: str, name: str) -> int | None:
+    for i, (stop_id, stop_name, _) in enumerate(itinerary):
+        if stop_id == station_id or stop_name == name:
+            return i
+    return None
+
+
+def _arrival_at(
+    itinerary: tuple, from_id: str, from_name: str, to_id: str, to_name: str
+) -> tuple[bool, str | None]:
+    """(B è dopo A nell'itinerario?, orario programmato in B HH:MM)."""
+    to_idx = _stop_index(itinerary, to_id, to_name)
+    if to_idx is None:
+        return False, None
+    from_idx = _stop_index(itinerary, from_id, from_name)
+    if from_idx is not None and from_idx >= to_idx:
+        return False, None
+    iso = ms_to_local_iso(itinerary[to_idx][2])
+    return True, iso[11:16] if iso else None
+
+
+async def fetch_commute(
+    hass: HomeAssistant,
+    from_id: str,
+    from_name: str,
+    to_id: str,
+    to_name: str,
+    config: BoardConfig = BoardConfig(),
+) -> Commute:
+    """
+    Prossimi treni da A che fermano in B: un solo tabellone partenze di A,
+    poi gli itinerari dalla cache del giorno; al più COMMUTE_LOOKUPS
+    itinerari nuovi per aggiornamento (gli altri arrivano ai giri dopo:
+    intanto la tratta è `partial`).
+    """
+    board = await fetch_data(
+        hass, from_id, replace(config, rows=max(config.rows, COMMUTE_SCAN_ROWS)),
+        kinds=("partenze",),
+    )
+    client = get_client(hass)
+    rows = [
+        row for row in board.partenze
+        if row.numero is not None and row.cod_origine and row.data_partenza
+    ]
+
+    missing = [
+        row for row in rows
+        if _cached_itinerary(
+            client, row.cod_origine, str(row.numero), row.data_partenza
+        ) is None
+    ][:COMMUTE_LOOKUPS]
+    for row, result in zip(missing, await _gather_partial(
+        *(
+            _async_itinerary(hass, row.cod_origine, str(row.numero), row.data_partenza)
+            for row in missing
+        )
+    )):
+        if isinstance(result, BaseException):
+            _LOGGER.debug("Itinerario treno %s non disponibile (%r)", row.numero, result)
+
+    from_name, to_name = normalize(from_name), normalize(to_name)
+    treni   = []
+    partial = False
+    for row in rows:
+        itinerary = _cached_itinerary(
+            client, row.cod_origine, str(row.numero), row.data_partenza
+        )
+        if itinerary is None:
+            partial = True          # treno da valutare a un giro successivo
+            continue
+        stops_there, arrivo = _arrival_at(itinerary, from_id, from_name, to_id, to_name)
+        if not stops_there:
+            continue
+        treni.append(
+            CommuteRow(
+                treno=row.treno,
+                orario=row.orario,
+                destinazione=row.localita,
+                arrivo=arrivo,
+                ritardo=row.ritardo,
+                binario=(
+                    row.binario_effettivo if row.binario_effettivo not in (None, "N/A")
+                    else row.binario_previsto
+                ),
+                soppresso=row.soppresso,
+                numero=row.numero,
+            )
+        )
+        if len(treni) >= config.rows:
+            break
+    return Commute(treni=treni, partial=partial)
@@ -0,0 +1,95 @@
+"""fetch_commute: primo giro con itinerari da scaricare, poi tutto dalla cache."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.mytreno import scheduler, utils  # noqa: E402
+
+_DEPARTURE_MS = 1760738400000
+
+
+def _row(number: int) -> dict:
+    return {
+        "numeroTreno":                          number,
+        "compNumeroTreno":                      f"REG {number}",
+        "categoriaDescrizione":                 "REG",
+        "compOrarioPartenza":                   f"10:{number:02d}",
+        "destinazione":                         "ROMA TERMINI",
+        "ritardo":                              0,
+        "binarioProgrammatoPartenzaDescrizione": "1",
+        "binarioEffettivoPartenzaDescrizione":  None,
+        "provvedimento":                        0,
+        "codOrigine":                           "S00001",
+        "dataPartenzaTreno":                    _DEPARTURE_MS,
+        "orarioPartenza":                       _DEPARTURE_MS,
+    }
+
+
+class _FakeClient:
+    """Risponde a partenze e tratteCanvas; i treni pari fermano anche in B."""
+
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows        = rows
+        self.calls:      list[str] = []
+        self.resolutions = {}
+        self.seeded      = {}
+        self.itineraries = {}
+
+    async def async_get(self, endpoint, *path, key=None, as_text=False):
+        self.calls.append(endpoint)
+        if endpoint == "partenze":
+            return 200, self.rows
+        if endpoint == "tratteCanvas":
+            stops = [{"fermata": {"id": "S00001", "stazione": "A", "programmata": _DEPARTURE_MS}}]
+            if int(path[1]) % 2 == 0:
+                stops.append({"fermata": {
+                    "id": "S00002", "stazione": "B", "programmata": _DEPARTURE_MS + 1800000,
+                }})
+            return 200, stops
+        return 404, None
+
+
+def _fetch(client: _FakeClient, monkeypatch):
+    monkeypatch.setattr(utils, "get_client", lambda hass: client)
+    return asyncio.run(
+        utils.fetch_commute(None, "S00001", "A", "S00002", "B", utils.BoardConfig(rows=3))
+    )
+
+
+def test_second_refresh_uses_cached_itineraries(monkeypatch):
+    client = _FakeClient([_row(n) for n in range(4)])
+
+    first = _fetch(client, monkeypatch)
+    assert [t.numero for t in first.treni] == [0, 2]
+    assert client.calls.count("tratteCanvas") == 4
+
+    client.calls.clear()
+    second = _fetch(client, monkeypatch)        # niente itinerari mancanti
+    assert [t.numero for t in second.treni] == [0, 2]
+    assert client.calls == ["partenze"]
+
+
+def test_rows_without_origin_need_no_lookups(monkeypatch):
+    rows = [{**_row(n), "codOrigine": None} for n in range(3)]
+    client = _FakeClient(rows)
+
+    assert _fetch(client, monkeypatch).treni == []
+    assert client.calls == ["partenze"]
+
+
+def test_partial_until_all_itineraries_are_known(monkeypatch):
+    monkeypatch.setattr(utils, "COMMUTE_LOOKUPS", 2)
+    client = _FakeClient([_row(n) for n in range(4)])
+
+    first = _fetch(client, monkeypatch)         # itinerari di 0 e 1 soltanto
+    assert [t.numero for t in first.treni] == [0]
+    assert first.partial
+    assert scheduler.station_interval(first) == scheduler.COMMUTE_PARTIAL
+
+    second = _fetch(client, monkeypatch)
+    assert [t.numero for t in second.treni] == [0, 2]
+    assert not second.partial
@@ -0,0 +1,113 @@
+"""SharedResources: entry caricate in parallelo creano gli oggetti condivisi una volta."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.mytreno import catalog, history, lifecycle, storage  # noqa: E402
+from custom_components.mytreno.const import (  # noqa: E402
+    DATA_CATALOG,
+    DATA_HISTORY,
+    DATA_STORE,
+    DOMAIN,
+)
+
+
+class _SlowLoad:
+    """Al posto di store, storico e catalogo: async_load cede il controllo."""
+
+    created = 0
+
+    def __init__(self, hass) -> None:
+        type(self).created += 1
+        self.started = 0
+
+    async def async_load(self) -> None:
+        await asyncio.sleep(0.01)
+
+    def async_start(self) -> None:
+        self.started += 1
+
+    def stations(self) -> dict[str, str]:
+        return {}
+
+
+class _FakeTracker:
+    def __init__(self, hass, store, history) -> None:
+        self.store       = store
+        self.history     = history
+        self.coordinator = None
+        self.next_interval = None
+
+    def async_restore(self) -> None:
+        pass
+
+
+class _FakeHass:
+    def __init__(self) -> None:
+        self.data: dict = {}
+
+    async def async_add_executor_job(self, func, *args):
+        return func(*args)
+
+
+class _FakeHub:
+    def __init__(self, hass) -> None:
+        self.jobs: list[str] = []
+
+    def async_register(self, name, coordinator, interval, first_in=None):
+        self.jobs.append(name)
+        return lambda: None
+
+    def async_start(self) -> None:
+        pass
+
+
+@pytest.fixture
+def resources(monkeypatch):
+    _SlowLoad.created = 0
+    for module, name in (
+        (storage, "MyTrenoStore"),
+        (history, "DelayHistory"),
+        (catalog, "StationCatalog"),
+    ):
+        monkeypatch.setattr(module, name, _SlowLoad)
+    monkeypatch.setattr(lifecycle, "TrainTracker", _FakeTracker)
+    monkeypatch.setattr(lifecycle, "HubScheduler", _FakeHub)
+    return lifecycle.SharedResources(_FakeHass())
+
+
+def test_concurrent_acquire_shares_objects(resources):
+    async def _run():
+        return await asyncio.gather(
+            resources.async_acquire("a"), resources.async_acquire("b")
+        )
+
+    assert sorted(asyncio.run(_run())) == [False, True]
+
+    domain_data = resources.hass.data[DOMAIN]
+    assert _SlowLoad.created == 3                 # store, storico, catalogo
+    assert resources.tracker.store is domain_data[DATA_STORE]
+    assert resources.tracker.history is domain_data[DATA_HISTORY]
+    assert resources.hub.jobs == [lifecycle.TRACKER_JOB]
+    assert domain_data[DATA_CATALOG].started == 2
+    assert resources.entries == {"a", "b"}
+
+
+def test_station_index_and_acquire_share_catalog(resources, monkeypatch):
+    monkeypatch.setattr(catalog, "StationIndex", dict)
+    hass = resources.hass
+
+    async def _run():
+        # config flow e setup di una entry chiedono il catalogo insieme
+        await asyncio.gather(
+            catalog.async_get_station_index(hass), catalog.async_get_catalog(hass)
+        )
+        await resources.async_acquire("a")
+
+    asyncio.run(_run())
+    assert _SlowLoad.created == 3
+    assert hass.data[DOMAIN][DATA_CATALOG].started == 1